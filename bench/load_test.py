@@ -0,0 +1,225 @@
+"""离线压测：启动本地模拟后端，用真实的 Utils 和命令处理函数并发生成视频
+
+在装有 AstrBot 的环境中运行：
+    python bench/load_test.py --jobs 200 --tokens 4 --task-limit 3
+"""
+
+import os
+import sys
+import time
+import asyncio
+import argparse
+import importlib
+import itertools
+import tempfile
+from collections import Counter
+from pathlib import Path
+from types import SimpleNamespace
+
+from mock_server import MockConfig, MockSora
+
+plugin_dir = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(plugin_dir.parent))
+plugin = importlib.import_module(f"{plugin_dir.name}.main")
+poller = importlib.import_module(f"{plugin_dir.name}.poller")
+metrics = importlib.import_module(f"{plugin_dir.name}.metrics").metrics
+
+import astrbot.api.message_components as Comp  # noqa: E402
+
+
+class BenchContext:
+    """收集插件主动推送的消息，排队任务的结果通过这里送达"""
+
+    def __init__(self):
+        self.waiters: dict[str, asyncio.Future] = {}
+
+    async def send_message(self, session_id, message_chain):
+        future = self.waiters.get(session_id)
+        if future and not future.done():
+            chain = message_chain.chain
+            if any(isinstance(c, Comp.Video) for c in chain):
+                future.set_result(None)
+            elif not any(
+                isinstance(c, Comp.Plain) and "请稍等" in c.text for c in chain
+            ):
+                future.set_result(_text(chain))
+        return True
+
+
+class BenchEvent:
+    """模拟一条 sora 命令消息"""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, text: str, user_id: int, image_url: str | None):
+        self.message_str = text
+        self.unified_msg_origin = f"bench:GroupMessage:{user_id}"
+        self.message_obj = SimpleNamespace(
+            message_id=next(self._ids),
+            sender=SimpleNamespace(user_id=user_id, nickname=f"bench{user_id}"),
+        )
+        self.image_url = image_url
+
+    def get_messages(self):
+        if not self.image_url:
+            return []
+        return [Comp.Image(file=self.image_url, url=self.image_url)]
+
+    def chain_result(self, chain):
+        return chain
+
+    async def send(self, chain):
+        pass
+
+
+def _text(chain) -> str:
+    return "".join(c.text for c in chain if isinstance(c, Comp.Plain))
+
+
+async def run_job(sora, context: BenchContext, index: int, args, image_url):
+    """返回 (是否成功, 耗时, 错误信息, 命令处理器占用时间)"""
+    event = BenchEvent(f"sora bench prompt {index}", index, image_url)
+    future = context.waiters[event.unified_msg_origin] = (
+        asyncio.get_running_loop().create_future()
+    )
+    start = time.monotonic()
+    err = None
+    handler = 0.0
+    try:
+        async for chain in sora.video_sora(event):
+            if any(isinstance(c, Comp.Video) for c in chain):
+                return True, time.monotonic() - start, None, time.monotonic() - start
+            text = _text(chain)
+            if not any(k in text for k in ("排队", "请稍等", "一起发送", "自动发送")):
+                err = text
+        handler = time.monotonic() - start
+        if err:
+            return False, handler, err, handler
+        # 提交后由后台任务推送结果，进入排队的任务由调度器推送结果
+        err = await asyncio.wait_for(future, args.timeout)
+        return err is None, time.monotonic() - start, err, handler
+    except asyncio.TimeoutError:
+        return False, time.monotonic() - start, "等待结果超时", handler
+    finally:
+        context.waiters.pop(event.unified_msg_origin, None)
+
+
+def percentile(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+async def main(args):
+    mock = MockSora(
+        MockConfig(
+            latency=args.latency,
+            jitter=args.jitter,
+            failure_rate=args.failure_rate,
+            throttle_rate=args.throttle_rate,
+            duration=args.duration,
+            curve=args.curve,
+        )
+    )
+    base_url = await mock.start()
+    image_url = f"{base_url}/image.png" if args.image else None
+
+    # 轮询间隔按比例缩短，方便用较短的生成时间压测
+    poller.min_interval *= args.poll_scale
+    poller.max_interval *= args.poll_scale
+    poller.total_wait = max(poller.total_wait, args.duration * 3)
+
+    # 数据写到临时目录，不影响正式数据
+    data_dir = Path(tempfile.mkdtemp(prefix="sora_bench_"))
+    plugin.StarTools = SimpleNamespace(get_data_dir=lambda *_: data_dir)
+    config = {
+        "authorization_list": [f"bench-token-{i:08d}" for i in range(args.tokens)],
+        "task_limit": args.task_limit,
+        "sora_base_url": base_url,
+        "chatgpt_base_url": base_url,
+        "queue_enabled": not args.no_queue,
+        "queue_max_size": args.jobs,
+        "dedup_window": 0,
+        "screen_mode": "竖屏",
+    }
+    context = BenchContext()
+    sora = plugin.VideoSora(context, config)
+    await sora.initialize()
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def limited(index: int):
+        async with semaphore:
+            return await run_job(sora, context, index, args, image_url)
+
+    start = time.monotonic()
+    results = await asyncio.gather(*(limited(i) for i in range(args.jobs)))
+    elapsed = time.monotonic() - start
+    await sora.terminate()
+    await mock.close()
+
+    latencies = [t for ok, t, _, _ in results if ok]
+    handlers = [h for _, _, _, h in results]
+    errors = Counter(err for ok, _, err, _ in results if not ok)
+    print(
+        f"任务数: {args.jobs}  成功: {len(latencies)}  失败: {args.jobs - len(latencies)}"
+    )
+    print(f"总耗时: {elapsed:.1f}s  吞吐: {len(latencies) / elapsed:.2f} 个/秒")
+    print(
+        f"耗时 P50: {percentile(latencies, 0.5):.1f}s  P90: {percentile(latencies, 0.9):.1f}s"
+        f"  P99: {percentile(latencies, 0.99):.1f}s  最大: {max(latencies, default=0):.1f}s"
+    )
+    print(
+        f"命令处理器占用 P50: {percentile(handlers, 0.5):.2f}s  P99: {percentile(handlers, 0.99):.2f}s"
+        f"  最大: {max(handlers, default=0):.2f}s"
+    )
+    print("上游请求（总数 / 每个任务）：")
+    for endpoint, count in sorted(mock.requests.items()):
+        print(f"  {endpoint:<12}{count:>8}{count / args.jobs:>10.2f}")
+    total = sum(mock.requests.values())
+    print(f"  {'total':<12}{total:>8}{total / args.jobs:>10.2f}")
+    print("插件侧统计：")
+    for line in metrics.endpoint_summary():
+        print(f"  {line}")
+    for err, count in errors.most_common(10):
+        print(f"失败 x{count}: {err}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="使用本地模拟后端压测 VideoSora")
+    parser.add_argument("--jobs", type=int, default=200, help="任务总数")
+    parser.add_argument("--concurrency", type=int, default=200, help="同时发起的请求数")
+    parser.add_argument("--tokens", type=int, default=4, help="模拟的Token数量")
+    parser.add_argument("--task-limit", type=int, default=3, help="每个Token的并发上限")
+    parser.add_argument(
+        "--latency", type=float, default=0.05, help="接口基础延迟（秒）"
+    )
+    parser.add_argument("--jitter", type=float, default=0.02, help="接口延迟抖动（秒）")
+    parser.add_argument(
+        "--failure-rate", type=float, default=0.0, help="接口返回500的概率"
+    )
+    parser.add_argument(
+        "--throttle-rate", type=float, default=0.0, help="接口返回429的概率"
+    )
+    parser.add_argument(
+        "--duration", type=float, default=20.0, help="单个视频的生成时间（秒）"
+    )
+    parser.add_argument(
+        "--curve",
+        choices=("linear", "ease", "stall"),
+        default="linear",
+        help="进度曲线",
+    )
+    parser.add_argument(
+        "--poll-scale", type=float, default=0.1, help="轮询间隔缩放比例"
+    )
+    parser.add_argument("--image", action="store_true", help="每个任务附带参考图片")
+    parser.add_argument("--no-queue", action="store_true", help="关闭任务排队")
+    parser.add_argument(
+        "--timeout", type=float, default=1800, help="单个任务最长等待时间（秒）"
+    )
+    args = parser.parse_args()
+    if os.name == "nt":
+        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+    asyncio.run(main(args))
@@ -0,0 +1,224 @@
+"""本地模拟的 Sora / ChatGPT 后端，只依赖标准库，用于离线压测"""
+
+import json
+import time
+import random
+import asyncio
+from collections import Counter
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from urllib.parse import urlsplit, parse_qs
+from uuid import uuid4
+
+# 1x1 PNG，作为参考图片
+PNG = bytes.fromhex(
+    "89504e470d0a1a0a0000000d4948445200000001000000010806000000"
+    "1f15c4890000000d49444154789c6360f8cfc0f01f0005000201a5f6"
+    "5bd40000000049454e44ae426082"
+)
+
+
+@dataclass
+class MockConfig:
+    latency: float = 0.05  # 接口基础延迟（秒）
+    jitter: float = 0.02  # 延迟随机抖动（秒）
+    failure_rate: float = 0.0  # 返回500的概率
+    throttle_rate: float = 0.0  # 返回429的概率
+    duration: float = 20.0  # 生成一个视频需要的时间（秒）
+    # 进度曲线：linear 匀速，ease 先慢后快，stall 在99%停留一段时间
+    curve: str = "linear"
+    video_bytes: int = 256 * 1024  # 下载视频的大小
+
+
+class _Task:
+    def __init__(self, authorization: str, duration: float):
+        self.id = "task_" + uuid4().hex
+        self.generation_id = "gen_" + uuid4().hex
+        self.authorization = authorization
+        self.started = time.monotonic()
+        self.duration = duration
+
+    def fraction(self) -> float:
+        return (time.monotonic() - self.started) / self.duration
+
+
+class MockSora:
+    """模拟上传、提交、排队查询、草稿列表、Sentinel和视频下载接口"""
+
+    def __init__(self, config: MockConfig):
+        self.config = config
+        self.tasks: list[_Task] = []
+        self.requests: Counter[str] = Counter()  # 按接口统计请求数
+        self.server: asyncio.AbstractServer | None = None
+        self.base_url = ""
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        self.server = await asyncio.start_server(self._handle, host, port)
+        port = self.server.sockets[0].getsockname()[1]
+        self.base_url = f"http://{host}:{port}"
+        return self.base_url
+
+    async def close(self):
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+
+    def _progress(self, task: _Task) -> float:
+        f = min(task.fraction(), 1.0)
+        if self.config.curve == "ease":
+            return f * f
+        if self.config.curve == "stall":
+            return min(f * 1.25, 0.99)
+        return f
+
+    def _expires(self) -> str:
+        expires = datetime.now(timezone.utc) + timedelta(hours=1)
+        return expires.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target, _ = request_line.decode().split(" ", 2)
+                headers = {}
+                while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    name, _, value = line.decode().partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                if headers.get("expect", "").lower() == "100-continue":
+                    writer.write(b"HTTP/1.1 100 Continue\r\n\r\n")
+                    await writer.drain()
+                length = int(headers.get("content-length") or 0)
+                body = await reader.readexactly(length) if length else b""
+                status, extra, payload = await self._route(
+                    method, target, headers, body
+                )
+                if isinstance(payload, (dict, list)):
+                    payload = json.dumps(payload).encode()
+                    extra.setdefault("Content-Type", "application/json")
+                head = f"HTTP/1.1 {status}\r\nContent-Length: {len(payload)}\r\n"
+                head += "".join(f"{k}: {v}\r\n" for k, v in extra.items())
+                writer.write(head.encode() + b"\r\n")
+                if method != "HEAD":
+                    writer.write(payload)
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def _route(
+        self, method: str, target: str, headers: dict, body: bytes
+    ) -> tuple[str, dict, bytes | dict | list]:
+        url = urlsplit(target)
+        path = url.path
+        query = parse_qs(url.query)
+        authorization = headers.get("authorization", "")
+        endpoint = self._endpoint(path)
+        self.requests[endpoint] += 1
+
+        # 静态资源不模拟延迟和故障
+        if endpoint == "image":
+            return "200 OK", {"Content-Type": "image/png"}, PNG
+        if endpoint == "video":
+            return (
+                "200 OK",
+                {"Content-Type": "video/mp4"},
+                b"\0" * self.config.video_bytes,
+            )
+
+        await asyncio.sleep(
+            max(0.0, self.config.latency + random.uniform(-1, 1) * self.config.jitter)
+        )
+        roll = random.random()
+        if roll < self.config.throttle_rate:
+            return (
+                "429 Too Many Requests",
+                {"Retry-After": "1"},
+                {"error": {"message": "Too many requests"}},
+            )
+        if roll < self.config.throttle_rate + self.config.failure_rate:
+            return (
+                "500 Internal Server Error",
+                {},
+                {"error": {"message": "mock failure"}},
+            )
+
+        if endpoint == "uploads":
+            return "200 OK", {}, {"id": "media_" + uuid4().hex}
+        if endpoint == "sentinel":
+            return "200 OK", {}, {"token": uuid4().hex, "turnstile": {"dx": "mock"}}
+        if endpoint == "create":
+            task = _Task(authorization, self.config.duration)
+            self.tasks.append(task)
+            return "200 OK", {}, {"id": task.id}
+        if endpoint == "pending":
+            return (
+                "200 OK",
+                {},
+                [
+                    {
+                        "id": t.id,
+                        "status": "running",
+                        "progress_pct": round(self._progress(t), 4),
+                    }
+                    for t in self.tasks
+                    if t.authorization == authorization and t.fraction() < 1
+                ],
+            )
+        if endpoint == "drafts":
+            done = [
+                t
+                for t in reversed(self.tasks)
+                if t.authorization == authorization and t.fraction() >= 1
+            ]
+            limit = int(query.get("limit", ["15"])[0])
+            offset = int(query.get("cursor", ["0"])[0])
+            page = done[offset : offset + limit]
+            return (
+                "200 OK",
+                {},
+                {
+                    "items": [self._draft(t) for t in page],
+                    "cursor": str(offset + limit)
+                    if offset + limit < len(done)
+                    else None,
+                },
+            )
+        if endpoint == "generation":
+            generation_id = path.rsplit("/", 1)[-1]
+            task = next(
+                (t for t in self.tasks if t.generation_id == generation_id), None
+            )
+            if task is None:
+                return "404 Not Found", {}, {"error": {"message": "not found"}}
+            return "200 OK", {}, self._draft(task)
+        return "404 Not Found", {}, {"error": {"message": "not found"}}
+
+    @staticmethod
+    def _endpoint(path: str) -> str:
+        if path == "/backend/uploads":
+            return "uploads"
+        if path == "/backend-api/sentinel/req":
+            return "sentinel"
+        if path == "/backend/nf/create":
+            return "create"
+        if path == "/backend/nf/pending":
+            return "pending"
+        if path == "/backend/project_y/profile/drafts":
+            return "drafts"
+        if path.startswith("/backend/project_y/profile/drafts/"):
+            return "generation"
+        if path.startswith("/videos/"):
+            return "video"
+        if path == "/image.png":
+            return "image"
+        return "other"
+
+    def _draft(self, task: _Task) -> dict:
+        return {
+            "id": task.generation_id,
+            "task_id": task.id,
+            "downloadable_url": f"{self.base_url}/videos/{task.generation_id}.mp4?se={self._expires()}",
+        }
@@ -0,0 +1,126 @@
+"""插件加载耗时基准：在全新的子进程中测量导入和 initialize / terminate 的耗时
+
+在装有 AstrBot 的环境中运行：
+    python bench/startup.py --runs 10
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import statistics
+import subprocess
+import tempfile
+from pathlib import Path
+from types import SimpleNamespace
+
+plugin_dir = Path(__file__).resolve().parent.parent
+
+# 只有真正用到时才应该导入的重量级模块
+heavy_modules = ("curl_cffi", "PIL", "aiosqlite", "pybase64")
+
+
+def _loaded() -> list[str]:
+    names = [name for name in heavy_modules if name in sys.modules]
+    if f"{plugin_dir.name}.openai_sentinel.config" in sys.modules:
+        names.append("openai_sentinel.config")
+    return names
+
+
+async def _child(reloads: int) -> dict:
+    """在子进程中执行一次冷启动，之后再模拟若干次重载"""
+    sys.path.insert(0, str(plugin_dir.parent))
+    start = time.perf_counter()
+    import importlib
+
+    plugin = importlib.import_module(f"{plugin_dir.name}.main")
+    import_ms = (time.perf_counter() - start) * 1000
+    after_import = _loaded()
+
+    data_dir = Path(tempfile.mkdtemp(prefix="sora_startup_"))
+    plugin.StarTools = SimpleNamespace(get_data_dir=lambda *_: data_dir)
+    config = {
+        "authorization_list": ["startup-token-0000"],
+        "sora_base_url": "http://127.0.0.1:9",
+        "chatgpt_base_url": "http://127.0.0.1:9",
+        "http_warmup": False,  # 不访问网络
+    }
+    cycles = []
+    for _ in range(1 + reloads):
+        sora = plugin.VideoSora(SimpleNamespace(), config)
+        start = time.perf_counter()
+        await sora.initialize()
+        init_ms = (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        await sora.terminate()
+        cycles.append((init_ms, (time.perf_counter() - start) * 1000))
+    return {
+        "import_ms": import_ms,
+        "init_ms": cycles[0][0],
+        "terminate_ms": cycles[0][1],
+        "reload_ms": [init + term for init, term in cycles[1:]],
+        "after_import": after_import,
+        "after_init": _loaded(),
+    }
+
+
+def _run_child(reloads: int) -> dict:
+    output = subprocess.run(
+        [sys.executable, __file__, "--child", "--reloads", str(reloads)],
+        check=True,
+        capture_output=True,
+        text=True,
+        env=os.environ,
+    ).stdout
+    # AstrBot 的日志也会输出到 stdout，结果在最后一行
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main(args):
+    results = [_run_child(args.reloads) for _ in range(args.runs)]
+
+    def summary(values: list[float]) -> str:
+        return f"中位数 {statistics.median(values):7.1f}ms  最小 {min(values):7.1f}ms  最大 {max(values):7.1f}ms"
+
+    print(f"运行次数: {args.runs}")
+    print(f"导入       {summary([r['import_ms'] for r in results])}")
+    print(f"initialize {summary([r['init_ms'] for r in results])}")
+    print(f"terminate  {summary([r['terminate_ms'] for r in results])}")
+    startup = [r["import_ms"] + r["init_ms"] for r in results]
+    print(f"冷启动合计 {summary(startup)}")
+    reloads = [ms for r in results for ms in r["reload_ms"]]
+    if reloads:
+        print(f"重载       {summary(reloads)}")
+    print(f"导入后已加载: {', '.join(results[0]['after_import']) or '无'}")
+    print(f"初始化后已加载: {', '.join(results[0]['after_init']) or '无'}")
+
+    failed = False
+    if args.check and results[0]["after_import"]:
+        print("检查失败：导入插件时加载了重量级依赖")
+        failed = True
+    if args.budget_ms and statistics.median(startup) > args.budget_ms:
+        print(f"检查失败：冷启动耗时超过 {args.budget_ms}ms")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="测量插件导入和初始化耗时")
+    parser.add_argument("--runs", type=int, default=10, help="冷启动次数")
+    parser.add_argument(
+        "--reloads", type=int, default=3, help="每次冷启动后模拟重载的次数"
+    )
+    parser.add_argument(
+        "--check", action="store_true", help="导入时加载了重量级依赖则返回非0"
+    )
+    parser.add_argument(
+        "--budget-ms", type=float, default=0, help="冷启动中位数超过该值时返回非0"
+    )
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        print(json.dumps(asyncio.run(_child(args.reloads))))
+    else:
+        main(args)
@@ -0,0 +1,120 @@
+import asyncio
+from typing import TYPE_CHECKING, Any, Iterable
+from astrbot.api import logger
+
+if TYPE_CHECKING:
+    import aiosqlite
+
+# 批量提交参数
+batch_size = 200  # 单次提交最多合并的写操作数
+batch_delay = 0.02  # 收到第一条写操作后再等待多久收集同一批（秒）
+
+
+class _Write:
+    """一条排队中的写操作"""
+
+    def __init__(self, sql: str, params: Any, many: bool, wait: bool):
+        self.sql = sql
+        self.params = params
+        self.many = many
+        self.future = asyncio.get_running_loop().create_future() if wait else None
+
+
+class Database:
+    """数据库访问层：所有写操作交给唯一的写入协程按批提交，读操作使用独立连接
+
+    开启 WAL 后读操作不会被写入阻塞，写入方也不再与其他协程共用游标
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.queue: asyncio.Queue[_Write | None] = asyncio.Queue()
+        self.writer_conn: "aiosqlite.Connection | None" = None
+        self.reader_conn: "aiosqlite.Connection | None" = None
+        self.writer_task: asyncio.Task | None = None
+
+    async def open(self):
+        import aiosqlite
+
+        self.writer_conn = await aiosqlite.connect(self.path)
+        await self.writer_conn.execute("PRAGMA journal_mode=WAL")
+        await self.writer_conn.execute("PRAGMA synchronous=NORMAL")
+        self.reader_conn = await aiosqlite.connect(self.path)
+        self.writer_task = asyncio.create_task(self._writer())
+
+    async def execute(self, sql: str, params: Iterable = ()) -> int | None:
+        """执行一条写操作，提交后返回 lastrowid"""
+        write = _Write(sql, tuple(params), many=False, wait=True)
+        self.queue.put_nowait(write)
+        return await write.future
+
+    async def executemany(self, sql: str, seq_of_params: Iterable[Iterable]):
+        write = _Write(sql, [tuple(p) for p in seq_of_params], many=True, wait=True)
+        self.queue.put_nowait(write)
+        await write.future
+
+    def execute_later(self, sql: str, params: Iterable = ()):
+        """写后即返回，不等待提交，用于丢失也无妨的状态更新"""
+        self.queue.put_nowait(_Write(sql, tuple(params), many=False, wait=False))
+
+    async def fetchone(self, sql: str, params: Iterable = ()) -> tuple | None:
+        async with self.reader_conn.execute(sql, tuple(params)) as cursor:
+            return await cursor.fetchone()
+
+    async def fetchall(self, sql: str, params: Iterable = ()) -> list[tuple]:
+        async with self.reader_conn.execute(sql, tuple(params)) as cursor:
+            return await cursor.fetchall()
+
+    async def _writer(self):
+        """唯一的写入协程，把排队的写操作合并到同一次提交"""
+        closing = False
+        while not closing:
+            write = await self.queue.get()
+            if write is None:
+                break
+            batch = [write]
+            await asyncio.sleep(batch_delay)
+            while len(batch) < batch_size and not self.queue.empty():
+                write = self.queue.get_nowait()
+                if write is None:
+                    closing = True
+                    break
+                batch.append(write)
+            await self._commit_batch(batch)
+
+    async def _commit_batch(self, batch: list[_Write]):
+        results = []
+        for write in batch:
+            try:
+                if write.many:
+                    cursor = await self.writer_conn.executemany(write.sql, write.params)
+                else:
+                    cursor = await self.writer_conn.execute(write.sql, write.params)
+                results.append((write, cursor.lastrowid, None))
+                await cursor.close()
+            except Exception as e:
+                # 单条语句失败不影响同批的其他语句
+                logger.error(f"数据库写入失败: {e}")
+                results.append((write, None, e))
+        try:
+            await self.writer_conn.commit()
+        except Exception as e:
+            logger.error(f"数据库提交失败: {e}")
+            results = [(write, None, e) for write, _, _ in results]
+        for write, lastrowid, err in results:
+            if write.future is None or write.future.done():
+                continue
+            if err:
+                write.future.set_exception(err)
+            else:
+                write.future.set_result(lastrowid)
+
+    async def close(self):
+        """提交所有排队中的写操作后关闭连接"""
+        if self.writer_task:
+            self.queue.put_nowait(None)
+            await self.writer_task
+        if self.writer_conn:
+            await self.writer_conn.close()
+        if self.reader_conn:
+            await self.reader_conn.close()
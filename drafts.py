@@ -0,0 +1,124 @@
+import time
+import asyncio
+from collections import OrderedDict
+from astrbot.api import logger
+from .utils import Utils
+
+# 草稿缓存参数
+drafts_ttl = 3  # 首页缓存有效期（秒）
+index_size = 500  # 每个Token最多缓存的草稿条目
+
+
+class _TokenDrafts:
+    """单个Token的草稿缓存"""
+
+    def __init__(self):
+        self.items: OrderedDict[str, dict] = OrderedDict()  # task_id -> 草稿
+        self.fetched_at = 0.0  # 首页最近一次拉取时间
+        self.next_cursor: str | None = None  # 首页之后的翻页游标
+        self.fetching: dict[tuple, asyncio.Future] = {}  # 正在进行的分页请求
+
+
+class DraftsCache:
+    """按Token缓存草稿列表，合并并发请求，并支持向后翻页查找较早的任务"""
+
+    def __init__(self, utils: Utils):
+        self.utils = utils
+        self.states: dict[str, _TokenDrafts] = {}
+
+    def _get_state(self, authorization: str) -> _TokenDrafts:
+        state = self.states.get(authorization)
+        if state is None:
+            state = self.states[authorization] = _TokenDrafts()
+        return state
+
+    async def _fetch_page(
+        self,
+        authorization: str,
+        state: _TokenDrafts,
+        limit: int,
+        cursor: str | None,
+    ) -> tuple[list[dict] | None, str | None, str | None, str | None]:
+        """拉取一页草稿，相同的分页请求共享同一次网络请求"""
+        key = (limit, cursor)
+        future = state.fetching.get(key)
+        if future is None:
+            future = state.fetching[key] = asyncio.ensure_future(
+                self._load(authorization, state, limit, cursor)
+            )
+            future.add_done_callback(lambda _: state.fetching.pop(key, None))
+        return await asyncio.shield(future)
+
+    async def _load(
+        self,
+        authorization: str,
+        state: _TokenDrafts,
+        limit: int,
+        cursor: str | None,
+    ) -> tuple[list[dict] | None, str | None, str | None, str | None]:
+        result = await self.utils.fetch_drafts(authorization, limit, cursor)
+        self._store(state, cursor, result)
+        return result
+
+    def _store(
+        self,
+        state: _TokenDrafts,
+        cursor: str | None,
+        result: tuple[list[dict] | None, str | None, str | None, str | None],
+    ):
+        """把拉取到的草稿写入索引"""
+        items, next_cursor, _, _ = result
+        if items is None:
+            return
+        if cursor is None:
+            state.fetched_at = time.monotonic()
+            state.next_cursor = next_cursor
+        for item in items:
+            task_id = item.get("task_id")
+            if not task_id:
+                continue
+            state.items[task_id] = item
+            state.items.move_to_end(task_id)
+        while len(state.items) > index_size:
+            state.items.popitem(last=False)
+
+    def forget(self, task_id: str, authorization: str):
+        """移除索引中的草稿，下次查找时重新拉取，用于下载地址过期的情况"""
+        state = self._get_state(authorization)
+        state.items.pop(task_id, None)
+        state.fetched_at = 0.0
+
+    async def fetch_video_url(
+        self, task_id: str, authorization: str, limit: int = 15, max_pages: int = 1
+    ) -> tuple[str | None, str | None, str | None, str | None]:
+        """查找任务对应的草稿，返回 (状态, 视频链接, generation_id, 错误信息)"""
+        state = self._get_state(authorization)
+        item = state.items.get(task_id)
+        # 草稿一旦出现即为终态，命中索引时无需再请求
+        if item is None and time.monotonic() - state.fetched_at > drafts_ttl:
+            _, _, status, err = await self._fetch_page(
+                authorization, state, limit, None
+            )
+            if err:
+                return status, None, None, err
+            item = state.items.get(task_id)
+        # 较早的任务不在首页，继续向后翻页
+        cursor = state.next_cursor
+        page = 1
+        while item is None and cursor and page < max_pages:
+            _, cursor, status, err = await self._fetch_page(
+                authorization, state, limit, cursor
+            )
+            if err:
+                return status, None, None, err
+            page += 1
+            item = state.items.get(task_id)
+        if item is None:
+            return "EXCEPTION", None, None, "未找到对应的视频"
+
+        downloadable_url = item.get("downloadable_url")
+        if not downloadable_url:
+            err_str = item.get("reason_str") or item.get("error_reason") or "未知错误"
+            logger.error(f"视频链接为空, task_id: {task_id}, reason: {err_str}")
+            return "Failed", None, item.get("id"), err_str
+        return "Done", downloadable_url, item.get("id"), None
@@ -0,0 +1,161 @@
+import time
+import asyncio
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import TYPE_CHECKING
+from urllib.parse import urlsplit
+from astrbot.api import logger
+
+# curl_cffi 导入较慢，第一次发起请求时才导入
+if TYPE_CHECKING:
+    from curl_cffi import AsyncSession, CurlMime
+
+max_hosts = 16  # 最多保留多少个主机的会话，超出时关闭最久未用的空闲会话
+warm_timeout = 10  # 预热请求的超时时间（秒）
+
+
+class Timeout(Exception):
+    """请求超时"""
+
+
+class SSLError(Exception):
+    """SSL握手或证书校验失败"""
+
+
+def _translate(e: Exception) -> Exception:
+    """把 curl_cffi 的异常转换为本模块的异常，调用方无需导入 curl_cffi"""
+    from curl_cffi.requests import exceptions
+
+    if isinstance(e, exceptions.Timeout):
+        return Timeout(str(e))
+    if isinstance(e, (exceptions.SSLError, exceptions.CertificateVerifyError)):
+        return SSLError(str(e))
+    return e
+
+
+def mime() -> "CurlMime":
+    """创建用于上传文件的 multipart 表单"""
+    from curl_cffi import CurlMime
+
+    return CurlMime()
+
+
+class _HostStats:
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.active = 0  # 正在进行的请求
+        self.peak = 0  # 同时进行请求数的峰值
+        self.waited = 0  # 因连接数已满而排队的请求
+        self.last_used = time.monotonic()
+
+
+class HttpPool:
+    """按主机划分的 curl_cffi 会话池，每个主机一个会话，复用TLS连接和HTTP/2多路复用"""
+
+    def __init__(
+        self, impersonate: str, proxies: dict | None = None, max_clients: int = 10
+    ):
+        self.impersonate = impersonate
+        self.proxies = proxies
+        self.max_clients = max_clients
+        self.sessions: OrderedDict[str, "AsyncSession"] = OrderedDict()
+        self.stats: dict[str, _HostStats] = {}
+
+    @staticmethod
+    def _host(url: str) -> str:
+        parts = urlsplit(url)
+        return f"{parts.scheme}://{parts.netloc}"
+
+    def _session(self, host: str) -> "AsyncSession":
+        session = self.sessions.get(host)
+        if session is None:
+            from curl_cffi import AsyncSession
+
+            session = self.sessions[host] = AsyncSession(
+                impersonate=self.impersonate,
+                proxies=self.proxies,
+                max_clients=self.max_clients,
+            )
+            self.stats.setdefault(host, _HostStats())
+            self._evict()
+        self.sessions.move_to_end(host)
+        return session
+
+    def _evict(self):
+        """关闭最久未用的空闲会话，例如只下载过一次图片的主机"""
+        for host in list(self.sessions)[:-1]:
+            if len(self.sessions) <= max_hosts:
+                break
+            if self.stats[host].active:
+                continue
+            session = self.sessions.pop(host)
+            del self.stats[host]
+            asyncio.ensure_future(session.close())
+
+    def _begin(self, host: str) -> _HostStats:
+        stats = self.stats[host]
+        if stats.active >= self.max_clients:
+            stats.waited += 1
+        stats.requests += 1
+        stats.active += 1
+        stats.peak = max(stats.peak, stats.active)
+        stats.last_used = time.monotonic()
+        return stats
+
+    async def request(self, method: str, url: str, **kwargs):
+        host = self._host(url)
+        session = self._session(host)
+        stats = self._begin(host)
+        try:
+            return await session.request(method, url, **kwargs)
+        except Exception as e:
+            stats.errors += 1
+            raise _translate(e) from e
+        finally:
+            stats.active -= 1
+
+    @asynccontextmanager
+    async def stream(self, method: str, url: str, **kwargs):
+        host = self._host(url)
+        session = self._session(host)
+        stats = self._begin(host)
+        try:
+            async with session.stream(method, url, **kwargs) as response:
+                yield response
+        except Exception as e:
+            stats.errors += 1
+            raise _translate(e) from e
+        finally:
+            stats.active -= 1
+
+    async def warm(self, urls: list[str], connections: int = 1):
+        """提前建立TLS连接，避免第一个用户请求承担握手耗时；失败不影响使用"""
+
+        async def touch(url: str):
+            try:
+                await self.request("HEAD", url, timeout=warm_timeout)
+            except Exception as e:
+                logger.debug(f"预热连接失败 {url}: {e}")
+
+        start = time.monotonic()
+        await asyncio.gather(*(touch(url) for url in urls for _ in range(connections)))
+        logger.info(f"HTTP连接预热完成，耗时 {time.monotonic() - start:.2f}s")
+
+    def snapshot(self) -> dict[str, dict[str, int]]:
+        """每个主机的请求数、失败数、当前并发、峰值并发和排队次数"""
+        return {
+            host: {
+                "requests": stats.requests,
+                "errors": stats.errors,
+                "active": stats.active,
+                "peak": stats.peak,
+                "waited": stats.waited,
+            }
+            for host, stats in self.stats.items()
+        }
+
+    async def close(self):
+        sessions = list(self.sessions.values())
+        self.sessions.clear()
+        await asyncio.gather(*(s.close() for s in sessions), return_exceptions=True)
@@ -0,0 +1,107 @@
+import asyncio
+from io import BytesIO
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from astrbot.api import logger
+
+# 图片规范化参数
+supported_formats = {"PNG", "JPEG", "WEBP"}  # 可以直接上传的格式
+max_pixels = 8000 * 8000  # 像素总数上限，防止解压炸弹
+jpeg_quality = 90
+
+
+def register_heif():
+    """安装了 pillow-heif 时支持读取 HEIC/HEIF 图片"""
+    try:
+        from pillow_heif import register_heif_opener
+
+        register_heif_opener()
+    except ImportError:
+        pass
+
+
+def normalize_image(
+    image_bytes: bytes, orientation: str, max_side: int
+) -> tuple[bytes, str]:
+    """在子进程中执行：转换为可上传的格式并按视频方向缩放，返回 (图片, 格式)
+
+    该函数需要能被子进程导入，因此只依赖 Pillow
+    """
+    from PIL import Image, ImageOps
+
+    Image.MAX_IMAGE_PIXELS = max_pixels  # 超出时 Pillow 直接抛出 DecompressionBombError
+    register_heif()
+
+    # 目标分辨率：横屏 16:9，竖屏 9:16
+    short_side = max_side * 9 // 16
+    box = (
+        (max_side, short_side) if orientation == "landscape" else (short_side, max_side)
+    )
+
+    with Image.open(BytesIO(image_bytes)) as img:
+        image_format = img.format
+        exif_orientation = img.getexif().get(0x0112, 1)
+        if (
+            image_format in supported_formats
+            and exif_orientation == 1
+            and img.width <= box[0]
+            and img.height <= box[1]
+        ):
+            return image_bytes, image_format  # 无需处理，原样上传
+        if getattr(img, "is_animated", False):
+            img.seek(0)  # 动图只取第一帧
+        img = ImageOps.exif_transpose(img)  # 手机照片按EXIF方向摆正
+        img.thumbnail(box, Image.Resampling.LANCZOS)
+        buf = BytesIO()
+        if img.mode in ("RGBA", "LA", "P") and (
+            img.mode != "P" or "transparency" in img.info
+        ):
+            img.convert("RGBA").save(buf, format="PNG", optimize=True)
+            return buf.getvalue(), "PNG"
+        img.convert("RGB").save(buf, format="JPEG", quality=jpeg_quality)
+        return buf.getvalue(), "JPEG"
+
+
+class ImageNormalizer:
+    """在有界进程池中规范化参考图片，避免大图处理受GIL限制阻塞其他任务"""
+
+    def __init__(self, workers: int, max_side: int):
+        self.workers = workers
+        self.max_side = max_side
+        self.executor: ProcessPoolExecutor | None = None
+
+    async def normalize(
+        self, image_bytes: bytes, width: int, height: int, orientation: str
+    ) -> tuple[bytes | None, str | None]:
+        """返回 (规范化后的图片, 错误信息)"""
+        # 解码前根据文件头尺寸拒绝超大图片
+        if width * height > max_pixels:
+            return None, "图片分辨率过大，请压缩后再试"
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(max_workers=self.workers)
+        loop = asyncio.get_running_loop()
+        try:
+            image_bytes, _ = await loop.run_in_executor(
+                self.executor, normalize_image, image_bytes, orientation, self.max_side
+            )
+            return image_bytes, None
+        except BrokenProcessPool:
+            # 进程池异常退出时重建，并退回到线程中处理本次图片
+            logger.warning("图片处理进程池已损坏，正在重建")
+            self.executor = None
+            try:
+                image_bytes, _ = await asyncio.to_thread(
+                    normalize_image, image_bytes, orientation, self.max_side
+                )
+                return image_bytes, None
+            except Exception as e:
+                logger.error(f"图片处理失败: {e}")
+                return None, "图片处理失败"
+        except Exception as e:
+            logger.error(f"图片处理失败: {e}")
+            return None, "图片处理失败，可能是不支持的图片格式"
+
+    def close(self):
+        if self.executor:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
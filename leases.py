@@ -0,0 +1,149 @@
+import os
+import time
+import socket
+import asyncio
+from uuid import uuid4
+from typing import TYPE_CHECKING
+from astrbot.api import logger
+
+if TYPE_CHECKING:
+    import aiosqlite
+
+# 租约参数
+lease_ttl = 60  # 租约有效期（秒），进程崩溃后最多这么久释放
+heartbeat_interval = 20  # 续期间隔（秒）
+
+
+class LeaseStore:
+    """多个进程共享的并发租约，保存在同一个 SQLite 文件中
+
+    每占用一个并发写入一条带过期时间的租约，持有者定期续期；进程崩溃后租约
+    过期即不再计数，同一主机上进程已退出的租约在下一次续期时直接回收
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid4().hex[:8]}"
+        self.conn: "aiosqlite.Connection | None" = None
+        self.lock = asyncio.Lock()  # 同一连接上的事务不能交错
+        self.held: dict[str, list[str]] = {}  # Token后缀 -> 本进程持有的租约ID
+        self.pending: set[asyncio.Task] = set()  # 还没写入的释放操作
+
+    async def open(self):
+        import aiosqlite
+
+        self.conn = await aiosqlite.connect(self.path, isolation_level=None)
+        await self.conn.execute("PRAGMA journal_mode=WAL")
+        await self.conn.execute("PRAGMA busy_timeout=5000")
+        await self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS leases (
+                id TEXT PRIMARY KEY NOT NULL,
+                token_suffix TEXT NOT NULL,
+                owner TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            )
+        """)
+        await self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_leases_token ON leases (token_suffix, expires_at)"
+        )
+
+    async def acquire(self, token: str, limit: int, force: bool = False) -> bool:
+        """所有进程合计的租约数小于 limit 时占用一个并发；force 为True时不检查上限"""
+        suffix = token[-8:]
+        lease_id = uuid4().hex
+        now = time.time()
+        async with self.lock:
+            # IMMEDIATE 事务先拿到写锁，计数和写入之间不会被其他进程插入
+            await self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                cursor = await self.conn.execute(
+                    """
+                    INSERT INTO leases (id, token_suffix, owner, expires_at)
+                    SELECT ?, ?, ?, ? WHERE ? OR (
+                        SELECT COUNT(*) FROM leases WHERE token_suffix = ? AND expires_at > ?
+                    ) < ?
+                    """,
+                    (lease_id, suffix, self.owner, now + lease_ttl)
+                    + (force, suffix, now, limit),
+                )
+                acquired = cursor.rowcount == 1
+                await cursor.close()
+                await self.conn.execute("COMMIT")
+            except BaseException:
+                await self.conn.execute("ROLLBACK")
+                raise
+        if acquired:
+            self.held.setdefault(suffix, []).append(lease_id)
+        return acquired
+
+    def release(self, token: str):
+        """释放本进程持有的一个租约，后台写入，不阻塞调用方"""
+        ids = self.held.get(token[-8:])
+        if not ids:
+            return
+        task = asyncio.ensure_future(self._delete(ids.pop()))
+        self.pending.add(task)
+        task.add_done_callback(self.pending.discard)
+
+    async def _delete(self, lease_id: str):
+        try:
+            async with self.lock:
+                await self.conn.execute("DELETE FROM leases WHERE id = ?", (lease_id,))
+        except Exception as e:
+            # 删除失败时租约到期后自然失效
+            logger.warning(f"释放并发租约失败: {e}")
+
+    async def heartbeat(self) -> dict[str, int]:
+        """续期本进程的租约并回收失效的租约，返回其他进程持有的租约数"""
+        now = time.time()
+        async with self.lock:
+            await self.conn.execute(
+                "UPDATE leases SET expires_at = ? WHERE owner = ?",
+                (now + lease_ttl, self.owner),
+            )
+            await self.conn.execute("DELETE FROM leases WHERE expires_at <= ?", (now,))
+            dead = [
+                owner
+                for (owner,) in await self.conn.execute_fetchall(
+                    "SELECT DISTINCT owner FROM leases WHERE owner != ?", (self.owner,)
+                )
+                if not self._alive(owner)
+            ]
+            for owner in dead:
+                logger.info(f"回收已退出进程 {owner} 的并发租约")
+                await self.conn.execute("DELETE FROM leases WHERE owner = ?", (owner,))
+            rows = await self.conn.execute_fetchall(
+                """
+                SELECT token_suffix, COUNT(*) FROM leases
+                WHERE owner != ? AND expires_at > ? GROUP BY token_suffix
+                """,
+                (self.owner, now),
+            )
+        return dict(rows)
+
+    @staticmethod
+    def _alive(owner: str) -> bool:
+        """同一主机上的进程可以直接检查是否还在运行，其他主机的只能等租约过期"""
+        host, pid, _ = owner.rsplit(":", 2)
+        if host != socket.gethostname():
+            return True
+        try:
+            os.kill(int(pid), 0)
+        except ProcessLookupError:
+            return False
+        except (PermissionError, ValueError):
+            pass
+        return True
+
+    async def close(self):
+        """删除本进程的全部租约后关闭连接"""
+        if self.pending:
+            await asyncio.gather(*self.pending, return_exceptions=True)
+        if self.conn:
+            try:
+                await self.conn.execute(
+                    "DELETE FROM leases WHERE owner = ?", (self.owner,)
+                )
+            finally:
+                await self.conn.close()
+        self.held.clear()
@@ -1,20 +1,54 @@
 import re
-import random
+import time
+import hashlib
 import asyncio
-import aiosqlite
 import os
 import astrbot.api.message_components as Comp
-from datetime import datetime
+from collections import OrderedDict
+from typing import Callable
+from datetime import datetime, timedelta
 from astrbot.api import logger
-from astrbot.api.event import filter, AstrMessageEvent
+from uuid import uuid4
+from astrbot.api.event import filter, AstrMessageEvent, MessageChain
 from astrbot.api.star import Context, Star, StarTools
 from astrbot.api.message_components import Video
 from .utils import Utils
+from .poller import PendingPoller
+from .drafts import DraftsCache
+from .scheduler import TokenScheduler
+from .upload_cache import UploadCache
+from .usage import UsageLedger
+from .leases import LeaseStore, heartbeat_interval
+from .video_cache import VideoCache
+from .image_normalize import ImageNormalizer
+from .db import Database
+from .metrics import metrics, serve, duration_buckets
 
 
 # 获取视频下载地址
 max_wait = 30  # 最大等待时间（秒）
 interval = 3  # 每次轮询间隔（秒）
+drafts_max_pages = 5  # 查询旧任务时草稿列表最多翻页数
+resume_hours = 24  # 重启后恢复多长时间内的未完成任务（小时）
+url_expire_margin = 300  # 下载地址距离过期不足该时间（秒）时提前刷新
+duration_samples = 50  # 启动时用最近多少个完成任务的耗时预测生成时间
+
+# 提交任务
+sentinel_attempts = 2  # 获取Sentinel因网络或限流失败时的尝试次数
+
+# 进度推送
+progress_milestones = (0.25, 0.5, 0.75)  # 开启 progress_notify 后在这些进度各推送一次
+
+# 历史记录
+history_page_size = 5  # 每页条数
+history_cache_size = 500  # 最多记住多少个用户的最近一次列表，用于按序号重放
+history_status = {
+    "排队": "Queued",
+    "成功": "Done",
+    "失败": "Failed",
+    "超时": "Timeout",
+    "异常": "EXCEPTION",
+}
 
 
 class VideoSora(Star):
@@ -25,25 +59,57 @@ class VideoSora(Star):
         chatgpt_base_url = self.config.get("chatgpt_base_url", "https://chatgpt.com")
         proxy = self.config.get("proxy")
         model = self.config.get("model", "sy_8")
-        self.utils = Utils(sora_base_url, chatgpt_base_url, proxy, model)
-        self.auth_dict = dict.fromkeys(self.config.get("authorization_list", []), 0)
+        image_max_bytes = self.config.get("image_max_mb", 20) * 1024 * 1024
+        self.utils = Utils(
+            sora_base_url,
+            chatgpt_base_url,
+            proxy,
+            model,
+            image_max_bytes,
+            self.config.get("http_max_clients", 10),
+        )
+        self.poller = PendingPoller(self.utils)
+        self.normalizer = ImageNormalizer(
+            self.config.get("image_workers", 2),
+            self.config.get("image_max_side", 1280),
+        )
+        self.drafts = DraftsCache(self.utils)
         self.screen_mode = self.config.get("screen_mode", "自动")
         self.def_prompt = self.config.get("default_prompt", "让图片画面动起来")
         self.speed_down_url_type = self.config.get("speed_down_url_type")
         self.speed_down_url = self.config.get("speed_down_url")
-        self.polling_task = set()
+        self.inflight: dict[str, asyncio.Task] = {}  # 正在等待完成的任务
         self.task_limit = self.config.get("task_limit", 3)
+        self.scheduler = TokenScheduler(
+            self.config.get("authorization_list", []),
+            self.task_limit,
+            self.config.get("schedule_strategy", "最少负载"),
+        )
         self.white_list_enabled = self.config.get("white_list_enabled", False)
         self.white_list = self.config.get("white_list", [])
+        self.queue_enabled = self.config.get("queue_enabled", True)
+        self.queue_max_size = self.config.get("queue_max_size", 50)
+        self.batch_max = self.config.get("batch_max", 4)
+        self.batch_results: dict[str, asyncio.Future] = {}  # 批量任务 -> 等待合并的结果
+        self.progress_notify = self.config.get("progress_notify", False)
+        self.queue_event = asyncio.Event()  # 有新的排队任务或者空出并发时唤醒调度器
+        self.background_tasks = set()
+        self.dedup_window = self.config.get("dedup_window", 300)
+        self.submitting: dict[str, asyncio.Future] = {}  # 正在提交的请求指纹 -> task_id
+        self.history_cache: OrderedDict[str, list[str]] = OrderedDict()
+
     async def initialize(self):
         """可选择实现异步的插件初始化方法，当实例化该插件类之后会自动调用该方法。"""
-        video_db_path = os.path.join(
-            StarTools.get_data_dir("astrbot_plugin_video_sora"), "video_data.db"
-        )
+        self.data_dir = StarTools.get_data_dir("astrbot_plugin_video_sora")
+        self.spool_dir = os.path.join(self.data_dir, "spool")
+        os.makedirs(self.spool_dir, exist_ok=True)
+        video_db_path = os.path.join(self.data_dir, "video_data.db")
         # 打开持久化连接
-        self.conn = await aiosqlite.connect(video_db_path)
-        self.cursor = await self.conn.cursor()
-        await self.cursor.execute("""
+        self.db = Database(video_db_path)
+        await self.db.open()
+        # 建表、补列和建索引各自合并到同一次提交，减少加载耗时
+        await asyncio.gather(
+            self.db.execute("""
             CREATE TABLE IF NOT EXISTS video_data (
                 task_id TEXT PRIMARY KEY NOT NULL,
                 user_id INTEGER,
@@ -59,194 +125,943 @@ class VideoSora(Star):
                 updated_at DATETIME,
                 created_at DATETIME
             )
-        """)
-        await self.conn.commit()
+        """),
+            self.db.execute("""
+            CREATE TABLE IF NOT EXISTS video_queue (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id TEXT,
+                user_id INTEGER,
+                nickname TEXT,
+                message_id INTEGER,
+                prompt TEXT,
+                image_url TEXT,
+                image_path TEXT,
+                screen_mode TEXT,
+                status TEXT,
+                created_at DATETIME
+            )
+        """),
+        )
+        await asyncio.gather(
+            self._ensure_columns(
+                "video_data",
+                {
+                    "session_id": "TEXT",
+                    "progress": "REAL",
+                    "fingerprint": "TEXT",
+                    "url_expires_at": "DATETIME",
+                },
+            ),
+            self._ensure_columns(
+                "video_queue", {"fingerprint": "TEXT", "batch_key": "TEXT"}
+            ),
+        )
+        await asyncio.gather(
+            *(
+                self.db.execute(
+                    f"CREATE INDEX IF NOT EXISTS idx_video_data_{column} ON video_data ({column})"
+                )
+                for column in ("status", "user_id", "created_at")
+            ),
+            # 历史记录按用户分页
+            self.db.execute(
+                "CREATE INDEX IF NOT EXISTS idx_video_data_user_created ON video_data (user_id, created_at, task_id)"
+            ),
+            self.db.execute(
+                "CREATE INDEX IF NOT EXISTS idx_video_data_user_status_created ON video_data (user_id, status, created_at, task_id)"
+            ),
+            # 查找时间窗口内的相同请求
+            self.db.execute(
+                "CREATE INDEX IF NOT EXISTS idx_video_data_fingerprint ON video_data (fingerprint, created_at)"
+            ),
+        )
+        self.upload_cache = UploadCache(
+            self.db,
+            self.config.get("upload_cache_hours", 24),
+            self.config.get("upload_cache_size", 2000),
+        )
+        # 每个Token每天的用量，调度时优先使用剩余额度多的Token
+        self.usage = UsageLedger(self.db, self.config.get("daily_quota", 0))
+        await asyncio.gather(self.upload_cache.initialize(), self.usage.initialize())
+        self.scheduler.usage = self.usage
+        for token in self.scheduler.tokens:
+            seconds = self.usage.exhausted_for(token)
+            if seconds:
+                # 重启前已经额度用尽的Token继续跳过
+                self.scheduler.exhaust(token, seconds)
+        # 本地视频缓存
+        self.video_cache = None
+        if self.config.get("video_cache_enabled", False):
+            self.video_cache = VideoCache(
+                self.utils,
+                os.path.join(self.data_dir, "videos"),
+                self.config.get("video_cache_max_mb", 2048) * 1024 * 1024,
+                self.config.get("video_cache_max_days", 7),
+            )
+            await asyncio.to_thread(self.video_cache.load)
+        # 用最近完成的任务耗时初始化轮询器的耗时预测
+        rows = await self.db.fetchall(
+            """
+            SELECT (julianday(updated_at) - julianday(created_at)) * 86400 FROM video_data
+            WHERE status = 'Done' AND video_url IS NOT NULL AND video_url != ''
+            ORDER BY created_at DESC LIMIT ?
+            """,
+            (duration_samples,),
+        )
+        for (duration,) in reversed(rows):
+            if duration:
+                self.poller.observe(duration)
+        await asyncio.gather(
+            # 上次退出时正在派发的任务还没提交成功，重新排队
+            self.db.execute(
+                "UPDATE video_queue SET status = 'waiting' WHERE status = 'dispatched'"
+            ),
+            # 旧版本在草稿列表故障时留下的空状态，改为超时以便重试
+            self.db.execute(
+                "UPDATE video_data SET status = 'Timeout' WHERE status IS NULL AND error_msg IS NOT NULL"
+            ),
+        )
+        # 指标，Token并发和排队长度在导出时计算
+        metrics.collectors.append(self._collect_metrics)
+        self.metrics_server = None
+        metrics_port = self.config.get("metrics_port", 0)
+        if metrics_port:
+            try:
+                self.metrics_server = await serve("127.0.0.1", metrics_port)
+            except OSError as e:
+                logger.error(f"指标服务启动失败: {e}")
+        # 后台预热上游连接，不阻塞插件加载
+        if self.config.get("http_warmup", True):
+            self._spawn(self.utils.warm())
+        # 多个实例共用Token时，并发数通过共享文件中的租约统计
+        lease_db_path = self.config.get("lease_db_path", "")
+        if lease_db_path:
+            leases = LeaseStore(lease_db_path)
+            try:
+                await leases.open()
+                self.scheduler.sync_leases(await leases.heartbeat())
+                self.scheduler.leases = leases
+                self._spawn(self._lease_loop())
+            except Exception as e:
+                logger.error(f"打开并发租约文件失败，只统计本实例的并发: {e}")
+                if leases.conn:
+                    await leases.conn.close()
+        # 启动排队调度器
+        self.dispatcher = asyncio.create_task(self._dispatch_loop())
+        # 恢复上次退出时还在生成中的任务
+        await self._resume_tasks()
 
-    async def quote_task(
-        self, event: AstrMessageEvent, task_id: str, authorization: str, is_check=False
-    ) -> tuple[str | None, str | None]:
-        """完成视频生成并发送视频"""
+    async def _collect_metrics(self) -> list[tuple[str, dict, float]]:
+        now = time.monotonic()
+        samples = []
+        for token in self.scheduler.tokens:
+            stats = self.scheduler.stats[token]
+            labels = {"token": token[-4:]}
+            samples += [
+                ("sora_token_active", labels, stats.active),
+                ("sora_token_remote_active", labels, stats.remote),
+                ("sora_token_limit", labels, self.task_limit),
+                ("sora_token_error_rate", labels, self.scheduler.error_rate(token)),
+                ("sora_token_latency_seconds", labels, stats.latency),
+                (
+                    "sora_token_cooldown_seconds",
+                    labels,
+                    max(0.0, stats.cooldown_until - now),
+                ),
+                (
+                    "sora_token_exhausted_seconds",
+                    labels,
+                    max(0.0, stats.exhausted_until - now),
+                ),
+                ("sora_token_used_today", labels, self.usage.used_today(token)),
+            ]
+            remaining = self.usage.remaining(token)
+            if remaining is not None:
+                samples.append(("sora_token_remaining_today", labels, remaining))
+        (waiting,) = await self.db.fetchone(
+            "SELECT COUNT(*) FROM video_queue WHERE status = 'waiting'"
+        )
+        samples += [
+            ("sora_queue_waiting", {}, waiting),
+            ("sora_tasks_inflight", {}, len(self.inflight)),
+            ("sora_task_expected_seconds", {}, self.poller.expected),
+        ]
+        for host, stats in self.utils.pool.snapshot().items():
+            labels = {"host": host}
+            samples += [
+                ("sora_http_active", labels, stats["active"]),
+                ("sora_http_peak", labels, stats["peak"]),
+                ("sora_http_queued_total", labels, stats["waited"]),
+            ]
+        return samples
 
-        # 检查是否已经有相同任务在处理
-        if task_id in self.polling_task:
-            status, _, progress = await self.utils.pending_video(task_id, authorization)
-            return (
-                None,
-                f"任务还在队列中，请稍后再看~\n状态：{status} 进度: {progress * 100:.2f}%",
-            )
-        # 优化人机交互
-        if is_check:
-            status, err, progress = await self.utils.pending_video(
-                task_id, authorization
+    async def _ensure_columns(self, table: str, columns: dict[str, str]):
+        """为旧版本数据库补齐新增的列"""
+        rows = await self.db.fetchall(f"PRAGMA table_info({table})")
+        existing = {row[1] for row in rows}
+        await asyncio.gather(
+            *(
+                self.db.execute(f"ALTER TABLE {table} ADD COLUMN {name} {decl}")
+                for name, decl in columns.items()
+                if name not in existing
             )
-            if err:
-                return None, err
-            if status != "Done":
-                await event.send(
-                    event.chain_result(
-                        [
-                            Comp.Reply(id=event.message_obj.message_id),
-                            Comp.Plain(
-                                f"任务还在队列中，请稍后再看~\n状态：{status} 进度: {progress * 100:.2f}%"
-                            ),
-                        ]
-                    )
-                )
-        self.polling_task.add(task_id)
-        try:
-            # 等待视频生成
-            result, err = await self.utils.poll_pending_video(task_id, authorization)
+        )
 
-            # 更新任务进度
-            await self.cursor.execute(
-                """
-                UPDATE video_data SET status = ?, error_msg = ?, updated_at = ? WHERE task_id = ?
+    async def _resume_tasks(self):
+        """重新接管未完成的任务，完成后把结果推送回原会话"""
+        since = (datetime.now() - timedelta(hours=resume_hours)).strftime(
+            "%Y-%m-%d %H:%M:%S"
+        )
+        rows = await self.db.fetchall(
+            """
+            SELECT task_id, session_id, message_id, auth_xor, progress FROM video_data
+            WHERE status IN ('Queued', 'Done') AND (video_url IS NULL OR video_url = '')
+                AND error_msg IS NULL AND created_at >= ?
             """,
-                (
-                    result,
-                    err,
-                    datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                    task_id,
-                ),  # "Done"表示任务队列状态结束，至于任务是否完成，不知道
+            (since,),
+        )
+        for task_id, session_id, message_id, auth_xor, progress in rows:
+            auth_token = self.scheduler.find(auth_xor)
+            if not auth_token:
+                logger.warning(f"任务 {task_id} 的Token已不存在，无法恢复")
+                continue
+            # 从停止前保存的进度继续预测完成时间
+            self.poller.resume(task_id, progress)
+            # 任务已经在上游生成，超出并发上限也要占用
+            await self.scheduler.acquire(auth_token, force=True)
+            self._spawn(
+                self._finish_task(
+                    session_id, message_id, task_id, auth_token, is_check=True
+                )
             )
-            await self.conn.commit()
+        if rows:
+            logger.info(f"已恢复 {len(rows)} 个未完成的视频任务")
 
-            if result != "Done" or err:
-                return None, err
+    async def quote_task(
+        self, task_id: str, authorization: str, is_check=False
+    ) -> tuple[str | None, str | None]:
+        """等待视频生成完成，返回下载地址"""
+        # 同一任务只等待一次，并发的查询共用同一个结果
+        return await asyncio.shield(self._track(task_id, authorization, is_check))
 
-            elapsed = 0
-            status = "Done"
-            video_url = ""
-            generation_id = None
-            err = None
-            # 获取视频下载地址
-            while elapsed < max_wait:
-                (
-                    status,
-                    video_url,
-                    generation_id,
-                    err,
-                ) = await self.utils.fetch_video_url(
-                    task_id, authorization, 30 if is_check else 15
-                )
-                if video_url or status == "Failed":
-                    break
-                await asyncio.sleep(interval)
-                elapsed += interval
-            if not video_url and not err:
-                status = "Timeout"
-                err = "获取视频下载地址超时"
-                logger.error(err)
-
-            # 更新任务进度
-            await self.cursor.execute(
-                """
-                UPDATE video_data SET status = ?, video_url = ?, generation_id = ?, error_msg = ?, updated_at = ? WHERE task_id = ?
-            """,
-                (
-                    status,
-                    video_url,
-                    generation_id,
-                    err,
-                    datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                    task_id,
-                ),
+    def _track(self, task_id: str, authorization: str, is_check=False) -> asyncio.Task:
+        """返回任务的完成过程，没有时启动一个；调用方被取消不影响其他等待者"""
+        task = self.inflight.get(task_id)
+        if task is None:
+            task = self.inflight[task_id] = self._spawn(
+                self._complete_task(task_id, authorization, is_check)
             )
-            await self.conn.commit()
+            task.add_done_callback(lambda _: self.inflight.pop(task_id, None))
+        return task
 
-            if not video_url or err:
-                return None, err or "生成视频超时"
+    async def _complete_task(
+        self, task_id: str, authorization: str, is_check=False
+    ) -> tuple[str | None, str | None]:
+        """等待任务结束并获取视频下载地址，同一任务的并发调用共用上游请求"""
+        start = time.monotonic()
+        video_url, err = await self._poll_task(task_id, authorization, is_check)
+        metrics.observe(
+            "sora_task_wait_seconds",
+            time.monotonic() - start,
+            duration_buckets,
+            result="ok" if video_url else "error",
+        )
+        return video_url, err
 
-            if self.speed_down_url:
-                if self.speed_down_url_type == "拼接":
-                    video_url = self.speed_down_url + video_url
-                elif self.speed_down_url_type == "替换":
-                    # 替换域名部分
-                    video_url = re.sub(
-                        r"^(https?://[^/]+)", self.speed_down_url.rstrip("/"), video_url
-                    )
+    async def _poll_task(
+        self, task_id: str, authorization: str, is_check: bool
+    ) -> tuple[str | None, str | None]:
+        # 等待视频生成
+        result, err = await self.poller.wait(task_id, authorization)
+
+        # 更新任务进度，中间状态无需等待提交
+        self.db.execute_later(
+            """
+            UPDATE video_data SET status = ?, error_msg = ?, updated_at = ? WHERE task_id = ?
+        """,
+            (
+                result,
+                err,
+                datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                task_id,
+            ),  # "Done"表示任务队列状态结束，至于任务是否完成，不知道
+        )
+
+        if result != "Done" or err:
+            return None, err
+
+        elapsed = 0
+        status = "Done"
+        video_url = ""
+        generation_id = None
+        err = None
+        # 获取视频下载地址
+        while elapsed < max_wait:
+            (
+                status,
+                video_url,
+                generation_id,
+                err,
+            ) = await self.drafts.fetch_video_url(
+                task_id,
+                authorization,
+                30 if is_check else 15,
+                drafts_max_pages if is_check else 1,
+            )
+            if video_url or status == "Failed":
+                break
+            await asyncio.sleep(interval)
+            elapsed += interval
+        if not video_url and not err:
+            status = "Timeout"
+            err = "获取视频下载地址超时"
+            logger.error(err)
+        elif not video_url and status is None:
+            # 草稿列表被限流或上游暂时故障直到超时，记为超时，之后可以用 sora查询 重试
+            status = "Timeout"
+
+        # 更新任务进度
+        await self.db.execute(
+            """
+            UPDATE video_data SET status = ?, video_url = ?, generation_id = ?, url_expires_at = ?, error_msg = ?, updated_at = ? WHERE task_id = ?
+        """,
+            (
+                status,
+                video_url,
+                generation_id,
+                self._expires_at(video_url),
+                err,
+                datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                task_id,
+            ),
+        )
+
+        if not video_url or err:
+            return None, err or "生成视频超时"
+
+        # 后台缓存到本地，供以后重放，不影响这次发送
+        if self.video_cache and generation_id:
+            self._spawn(self.video_cache.fetch(generation_id, video_url))
+        return self._speed_url(video_url), None
+
+    @staticmethod
+    def _expires_at(video_url: str | None) -> str | None:
+        expires_at = Utils.url_expires_at(video_url) if video_url else None
+        return expires_at.strftime("%Y-%m-%d %H:%M:%S") if expires_at else None
+
+    async def _fresh_url(
+        self,
+        task_id: str,
+        video_url: str,
+        generation_id: str | None,
+        expires_at: str | None,
+        auth_xor: str | None,
+    ) -> tuple[str | None, str | None]:
+        """返回仍然有效的下载地址，已过期时根据 generation_id 重新获取"""
+        if expires_at:
+            deadline = datetime.now() + timedelta(seconds=url_expire_margin)
+            if datetime.strptime(expires_at, "%Y-%m-%d %H:%M:%S") > deadline:
+                return video_url, None
+        # 不知道过期时间时用HEAD请求检查，无法判断时按有效处理
+        elif await self.utils.check_url(video_url) is not False:
             return video_url, None
-        finally:
-            self.polling_task.remove(task_id)
+        auth_token = self.scheduler.find(auth_xor)
+        if not auth_token:
+            return None, "下载地址已过期，且Token不存在，无法重新获取"
+        authorization = "Bearer " + auth_token
+        new_url, err = None, None
+        if generation_id:
+            new_url, err = await self.utils.fetch_generation_url(
+                authorization, generation_id
+            )
+        if not new_url:
+            # 接口不可用时退回到草稿列表查找
+            self.drafts.forget(task_id, authorization)
+            _, new_url, _, err = await self.drafts.fetch_video_url(
+                task_id, authorization, 30, drafts_max_pages
+            )
+        if not new_url:
+            return None, err or "下载地址已过期，重新获取失败"
+        self.db.execute_later(
+            "UPDATE video_data SET video_url = ?, url_expires_at = ?, updated_at = ? WHERE task_id = ?",
+            (
+                new_url,
+                self._expires_at(new_url),
+                datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                task_id,
+            ),
+        )
+        return new_url, None
+
+    async def _video(self, video_url: str, generation_id: str | None) -> Video:
+        """生成视频消息，开启本地缓存时发送本地文件，缓存失败时退回下载地址"""
+        if self.video_cache and generation_id:
+            path, err = await self.video_cache.fetch(generation_id, video_url)
+            if path:
+                return Video.fromFileSystem(path)
+            logger.warning(f"缓存视频 {generation_id} 失败: {err}")
+        return Video.fromURL(url=self._speed_url(video_url))
+
+    def _speed_url(self, video_url: str) -> str:
+        """按配置为下载地址加速"""
+        if self.speed_down_url:
+            if self.speed_down_url_type == "拼接":
+                video_url = self.speed_down_url + video_url
+            elif self.speed_down_url_type == "替换":
+                # 替换域名部分
+                video_url = re.sub(
+                    r"^(https?://[^/]+)", self.speed_down_url.rstrip("/"), video_url
+                )
+        return video_url
+
+    def _release(self, auth_token: str):
+        """释放并发，并唤醒排队调度器"""
+        self.scheduler.release(auth_token)
+        self.queue_event.set()
 
     async def create_video(
         self,
-        event: AstrMessageEvent,
-        image_url: str,
+        job: dict,
         image_bytes: bytes | None,
-        prompt: str,
-        screen_mode: str,
         authorization: str,
-    ) -> str | None:
+        sentinel_token: str | None = None,
+    ) -> tuple[str | None, str | None]:
         """创建视频生成任务"""
         # 如果消息中携带图片，上传图片到OpenAI端点
         images_id = ""
         if image_bytes:
-            images_id, err = await self.utils.upload_images(authorization, image_bytes)
+            # 同一张图片在同一个Token下只上传一次
+            if "image_hash" not in job:
+                job["image_hash"] = UploadCache.digest(image_bytes)
+            images_id, err = await self.upload_cache.get_or_upload(
+                job["image_hash"],
+                authorization,
+                lambda: self.utils.upload_images(authorization, image_bytes),
+            )
             if not images_id or err:
                 return None, err
 
         # 生成视频
         task_id, err = await self.utils.create_video(
-            prompt, screen_mode, images_id, authorization
+            job["prompt"], job["screen_mode"], images_id, authorization, sentinel_token
         )
         if not task_id or err:
             return None, err
 
         # 记录任务数据
         datetime_now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        await self.cursor.execute(
+        await self.db.execute(
             """
-            INSERT INTO video_data (task_id, user_id, nickname, prompt, image_url, status, message_id, auth_xor, updated_at, created_at)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            INSERT INTO video_data (task_id, user_id, nickname, prompt, image_url, status, message_id, session_id, fingerprint, auth_xor, updated_at, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
             """,
             (
                 task_id,
-                event.message_obj.sender.user_id,
-                event.message_obj.sender.nickname,
-                prompt,
-                image_url,
+                job["user_id"],
+                job["nickname"],
+                job["prompt"],
+                job["image_url"],
                 "Queued",
-                event.message_obj.message_id,
+                job["message_id"],
+                job["session_id"],
+                job.get("fingerprint"),
                 authorization[-8:],  # 只存储token的最后8位以作区分
                 datetime_now,
                 datetime_now,
             ),
         )
-        await self.conn.commit()
         # 返回结果
         return task_id, None
 
-    @filter.command("sora", alias={"生成视频", "视频生成"})
-    async def video_sora(self, event: AstrMessageEvent):
-        """使用sora模型生成视频"""
-        # 先检测AccessToken是否存在
-        if not self.auth_dict:
-            yield event.chain_result(
+    async def _submit(
+        self, job: dict, image_bytes: bytes | None, auth_token: str | None = None
+    ) -> tuple[str | None, str | None, str | None]:
+        """依次尝试可用Token提交任务，成功后保留该Token的并发占用
+
+        auth_token 为调用方已经占用并发的Token，会被优先尝试
+        """
+        tried = set()
+        err = (
+            "今天的额度已用完，请明天再试"
+            if self.scheduler.out_of_quota()
+            else "当前并发数过多，请稍后再试"
+        )
+        sentinel = None
+        auth_retried = set()  # 认证失败后已经换新Sentinel重试过的Token
+        while True:
+            if auth_token is None:
+                candidates = self.scheduler.candidates(exclude=tried)
+                if not candidates:
+                    return None, None, err
+                auth_token = candidates[0]
+                if not await self.scheduler.acquire(auth_token):
+                    # 并发刚被其他实例占满
+                    tried.add(auth_token)
+                    auth_token = None
+                    continue
+            tried.add(auth_token)
+            try:
+                # Sentinel 与Token无关，换Token重试时复用，不再重新计算工作量证明
+                if sentinel is None:
+                    sentinel, err = await self._get_sentinel()
+                    if not sentinel:
+                        self._release(auth_token)
+                        return None, None, err
+                start = time.monotonic()
+                task_id, err = await self.create_video(
+                    job, image_bytes, "Bearer " + auth_token, sentinel
+                )
+            except BaseException:
+                self._release(auth_token)
+                raise
+            latency = time.monotonic() - start
+            if task_id:
+                self.scheduler.record(auth_token, True, latency)
+                return task_id, auth_token, None
+            kind = getattr(err, "kind", "unknown")
+            if kind == "auth" and auth_token not in auth_retried:
+                # 也可能是Sentinel被拒绝，保留并发换新的Sentinel再试一次，仍失败才算Token失效
+                auth_retried.add(auth_token)
+                sentinel = None
+                continue
+            # 额度用尽、限流和失效的Token按错误类型暂停调度，后续请求直接跳过
+            self.scheduler.record_failure(
+                auth_token, kind, getattr(err, "retry_after", None), latency
+            )
+            self._release(auth_token)
+            auth_token = None
+            if kind in ("content", "invalid"):
+                # 提示词或图片的问题，换Token也不会成功
+                return None, None, err
+
+    async def _get_sentinel(self) -> tuple[str | None, str | None]:
+        """获取Sentinel，网络异常或限流导致的失败会重试"""
+        for _ in range(sentinel_attempts):
+            sentinel, err = await self.utils.get_sentinel()
+            if sentinel or getattr(err, "kind", None) not in (
+                "transient",
+                "rate_limit",
+            ):
+                break
+        return sentinel, err
+
+    def _fingerprint(
+        self, prompt: str, image_hash: str | None, screen_mode: str
+    ) -> str:
+        """请求指纹：提示词（忽略大小写和多余空白）、图片、方向和模型都相同视为同一请求"""
+        normalized = " ".join(prompt.lower().split())
+        key = f"{normalized}\n{image_hash or ''}\n{screen_mode}\n{self.utils.model}"
+        return hashlib.sha256(key.encode()).hexdigest()
+
+    async def _claim_fingerprint(self, fingerprint: str) -> str | None:
+        """查找时间窗口内的相同请求并返回其task_id
+
+        没有相同请求时登记为正在提交并返回None，调用方提交结束后必须调用 _settle_fingerprint
+        """
+        # 相同请求正在提交时等待其结果，提交失败则由下一个请求接手
+        while future := self.submitting.get(fingerprint):
+            task_id = await asyncio.shield(future)
+            if task_id:
+                return task_id
+        self.submitting[fingerprint] = asyncio.get_running_loop().create_future()
+        since = (datetime.now() - timedelta(seconds=self.dedup_window)).strftime(
+            "%Y-%m-%d %H:%M:%S"
+        )
+        try:
+            row = await self.db.fetchone(
+                """
+                SELECT task_id FROM video_data
+                WHERE fingerprint = ? AND created_at >= ? AND status IN ('Queued', 'Done') AND error_msg IS NULL
+                ORDER BY created_at DESC LIMIT 1
+                """,
+                (fingerprint, since),
+            )
+        except BaseException:
+            # 查询失败或被取消时撤销登记，否则相同的请求会一直等待
+            self._settle_fingerprint(fingerprint, None)
+            raise
+        if row:
+            self._settle_fingerprint(fingerprint, row[0])
+            return row[0]
+        return None
+
+    def _settle_fingerprint(self, fingerprint: str | None, task_id: str | None):
+        """提交结束，通知等待中的相同请求"""
+        future = self.submitting.pop(fingerprint, None)
+        if future and not future.done():
+            future.set_result(task_id)
+
+    async def _await_task(self, task_id: str) -> tuple[str | None, str | None]:
+        """等待已有任务的结果，供重复的请求共用，不占用并发"""
+        task = self.inflight.get(task_id)
+        if task:
+            return await asyncio.shield(task)
+        row = await self.db.fetchone(
+            "SELECT status, video_url, generation_id, url_expires_at, error_msg, auth_xor FROM video_data WHERE task_id = ?",
+            (task_id,),
+        )
+        if not row:
+            return None, "未找到对应的视频任务"
+        status, video_url, generation_id, expires_at, error_msg, auth_xor = row
+        if video_url:
+            video_url, err = await self._fresh_url(
+                task_id, video_url, generation_id, expires_at, auth_xor
+            )
+            return (self._speed_url(video_url), None) if video_url else (None, err)
+        if status == "Failed":
+            return None, error_msg or "视频生成失败"
+        auth_token = self.scheduler.find(auth_xor)
+        if not auth_token:
+            return None, "Token不存在，无法查询视频生成状态"
+        return await asyncio.shield(self._track(task_id, "Bearer " + auth_token, True))
+
+    async def _send(self, session_id: str, chain: list):
+        """主动向会话发送消息"""
+        try:
+            await self.context.send_message(session_id, MessageChain(chain=chain))
+        except Exception as e:
+            logger.error(f"发送消息失败: {e}")
+
+    async def _enqueue(
+        self, job: dict, image_bytes: bytes | None
+    ) -> tuple[int | None, str | None]:
+        """把任务写入排队表，返回排队位置"""
+        (waiting,) = await self.db.fetchone(
+            "SELECT COUNT(*) FROM video_queue WHERE status = 'waiting'"
+        )
+        if waiting >= self.queue_max_size:
+            return None, "当前排队任务过多，请稍后再试"
+        # 图片落盘，排队期间不占用内存
+        image_path = None
+        if image_bytes:
+            image_path = os.path.join(self.spool_dir, uuid4().hex)
+            await asyncio.to_thread(self._write_file, image_path, image_bytes)
+        job_id = await self.db.execute(
+            """
+            INSERT INTO video_queue (session_id, user_id, nickname, message_id, prompt, image_url, image_path, screen_mode, fingerprint, batch_key, status, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            (
+                job["session_id"],
+                job["user_id"],
+                job["nickname"],
+                job["message_id"],
+                job["prompt"],
+                job["image_url"],
+                image_path,
+                job["screen_mode"],
+                job.get("fingerprint"),
+                job.get("batch_key"),
+                "waiting",
+                datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            ),
+        )
+        self.queue_event.set()
+        (position,) = await self.db.fetchone(
+            "SELECT COUNT(*) FROM video_queue WHERE status = 'waiting' AND id <= ?",
+            (job_id,),
+        )
+        return position, None
+
+    @staticmethod
+    def _write_file(path: str, data: bytes):
+        with open(path, "wb") as f:
+            f.write(data)
+
+    @staticmethod
+    def _read_file(path: str) -> bytes:
+        with open(path, "rb") as f:
+            return f.read()
+
+    async def _dispatch_loop(self):
+        """排队调度器，有空闲并发时按顺序派发排队任务"""
+        while True:
+            self.queue_event.clear()
+            try:
+                await self._dispatch_waiting()
+            except Exception as e:
+                logger.error(f"排队任务派发失败: {e}")
+            # 有Token在冷却时，冷却结束后也需要重新派发
+            await self._wait_for_slot(min(30, self.scheduler.next_available_in() or 30))
+
+    async def _wait_for_slot(self, timeout: float):
+        """等待空出并发或有新的排队任务，最多等待 timeout 秒"""
+        # 不使用 wait_for：事件与取消同时发生时它会吞掉取消，导致插件无法停止
+        waiter = asyncio.ensure_future(self.queue_event.wait())
+        try:
+            await asyncio.wait({waiter}, timeout=timeout)
+        finally:
+            waiter.cancel()
+
+    async def _lease_loop(self):
+        """定期续期本实例的租约，并同步其他实例占用的并发"""
+        while True:
+            await asyncio.sleep(heartbeat_interval)
+            try:
+                remote = await self.scheduler.leases.heartbeat()
+            except Exception as e:
+                logger.error(f"续期并发租约失败: {e}")
+                continue
+            if self.scheduler.sync_leases(remote):
+                # 其他实例释放了并发，派发排队任务
+                self.queue_event.set()
+
+    async def _dispatch_waiting(self):
+        while True:
+            if not self.scheduler.candidates():
+                return
+            row = await self.db.fetchone(
+                """
+                SELECT id, session_id, user_id, nickname, message_id, prompt, image_url, image_path, screen_mode, fingerprint, batch_key, created_at
+                FROM video_queue WHERE status = 'waiting' ORDER BY id LIMIT 1
+                """
+            )
+            if not row:
+                return
+            job = dict(
+                zip(
+                    (
+                        "id",
+                        "session_id",
+                        "user_id",
+                        "nickname",
+                        "message_id",
+                        "prompt",
+                        "image_url",
+                        "image_path",
+                        "screen_mode",
+                        "fingerprint",
+                        "batch_key",
+                        "created_at",
+                    ),
+                    row,
+                )
+            )
+            # 先占用并发再派发，避免同一个空位被重复派发
+            auth_token = await self._acquire_candidate()
+            if auth_token is None:
+                return
+            await self.db.execute(
+                "UPDATE video_queue SET status = 'dispatched' WHERE id = ?",
+                (job["id"],),
+            )
+            queued = datetime.now() - datetime.strptime(
+                job["created_at"], "%Y-%m-%d %H:%M:%S"
+            )
+            metrics.observe(
+                "sora_queue_wait_seconds", queued.total_seconds(), duration_buckets
+            )
+            task = self._spawn(self._run_queued_job(job, auth_token))
+            collector = self.batch_results.get(job["batch_key"] or "")
+            if collector:
+                # 任务异常退出时也要给批量一个结果，否则合并发送会一直等待
+                task.add_done_callback(
+                    lambda _, c=collector: (
+                        c.done() or c.set_result((None, None, "批量任务处理失败"))
+                    )
+                )
+
+    async def _acquire_candidate(self) -> str | None:
+        """按调度顺序占用第一个还有空闲并发的Token，都已占满时返回None"""
+        for token in self.scheduler.candidates():
+            if await self.scheduler.acquire(token):
+                return token
+        return None
+
+    def _spawn(self, coro) -> asyncio.Task:
+        """启动由插件托管的后台任务，插件停止时统一取消"""
+        task = asyncio.create_task(coro)
+        self.background_tasks.add(task)
+        task.add_done_callback(self.background_tasks.discard)
+        return task
+
+    async def _run_queued_job(self, job: dict, auth_token: str):
+        """执行一个排队任务，并把结果推送回原会话；批量任务的结果交给 _finish_batch 合并发送"""
+        # 重启后批量已不在内存中，其中的任务按普通排队任务逐个发送
+        collector = self.batch_results.pop(job["batch_key"] or "", None)
+        task_id, err = None, None
+        duplicate = None
+        # 排队期间可能已有相同的请求提交过了
+        if self.dedup_window and job["fingerprint"]:
+            try:
+                duplicate = await self._claim_fingerprint(job["fingerprint"])
+            except BaseException:
+                # 调度器已经占用了并发
+                self._release(auth_token)
+                raise
+        try:
+            image_bytes = None
+            if duplicate:
+                self._release(auth_token)
+            elif job["image_path"]:
+                try:
+                    image_bytes = await asyncio.to_thread(
+                        self._read_file, job["image_path"]
+                    )
+                except OSError as e:
+                    logger.error(f"读取排队图片失败: {e}")
+                    err = "读取排队图片失败"
+                    self._release(auth_token)
+            if not err and not duplicate:
+                try:
+                    task_id, auth_token, err = await self._submit(
+                        job, image_bytes, auth_token
+                    )
+                except Exception as e:
+                    logger.error(f"排队任务提交失败: {e}")
+                    err = "提交任务失败"
+        finally:
+            if not duplicate:
+                self._settle_fingerprint(job["fingerprint"], task_id)
+        # 提交结束后移出排队表；中途被取消的任务保留在表中，下次启动时重新排队
+        await self.db.execute("DELETE FROM video_queue WHERE id = ?", (job["id"],))
+        if job["image_path"] and os.path.exists(job["image_path"]):
+            os.remove(job["image_path"])
+
+        if collector:
+            if task_id:
+                await self._collect_batch_job(task_id, auth_token, collector)
+            elif not collector.done():
+                collector.set_result((None, None, err))
+            return
+        if duplicate:
+            await self._send(
+                job["session_id"],
                 [
-                    Comp.Reply(id=event.message_obj.message_id),
-                    Comp.Plain("请先在插件配置中添加Authorization"),
-                ]
+                    Comp.Reply(id=job["message_id"]),
+                    Comp.Plain(
+                        f"相同的视频已经在生成了，完成后会一起发送~\nID: {duplicate}"
+                    ),
+                ],
+            )
+            await self._finish_duplicate(
+                job["session_id"], job["message_id"], duplicate
             )
             return
-        if self.white_list_enabled:
-            session_id = event.unified_msg_origin
-            if session_id not in self.white_list:
-                yield event.chain_result(
+        if not task_id:
+            await self._send(
+                job["session_id"],
+                [Comp.Reply(id=job["message_id"]), Comp.Plain(err)],
+            )
+            return
+        await self._send(
+            job["session_id"],
+            [
+                Comp.Reply(id=job["message_id"]),
+                Comp.Plain(f"排队任务已开始生成，请稍等~\nID: {task_id}"),
+            ],
+        )
+        await self._finish_task(
+            job["session_id"], job["message_id"], task_id, auth_token
+        )
+
+    async def _finish_task(
+        self,
+        session_id: str | None,
+        message_id: int | None,
+        task_id: str,
+        auth_token: str,
+        is_check=False,
+        release=True,
+    ):
+        """等待已提交的任务完成并把结果推送回原会话，结束后释放并发
+
+        命令处理器提交任务后立即返回，等待和推送都在这里的后台任务中完成
+        """
+        unsubscribe = None
+        if session_id and self.progress_notify:
+            unsubscribe = self.poller.listen(
+                task_id, self._progress_notifier(session_id, message_id, task_id)
+            )
+        try:
+            video_url, msg = await self.quote_task(
+                task_id, "Bearer " + auth_token, is_check
+            )
+            if not session_id:
+                return
+            if not video_url:
+                await self._send(
+                    session_id, [Comp.Reply(id=message_id), Comp.Plain(msg)]
+                )
+                return
+            await self._send(session_id, [Video.fromURL(url=video_url)])
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"任务 {task_id} 处理失败: {e}")
+            # 处理器已经返回，这里是用户得知结果的唯一途径
+            if session_id:
+                await self._send(
+                    session_id,
                     [
-                        Comp.Reply(id=event.message_obj.message_id),
-                        Comp.Plain("您没有权限使用该插件,请联系管理员添加sid白名单"),
-                    ]
+                        Comp.Reply(id=message_id),
+                        Comp.Plain(f"任务处理失败，可用 sora查询 {task_id} 重试"),
+                    ],
                 )
+        finally:
+            if unsubscribe:
+                unsubscribe()
+            if release:
+                self._release(auth_token)
+
+    def _progress_notifier(
+        self, session_id: str, message_id: int | None, task_id: str
+    ) -> Callable[[float, float], None]:
+        """生成进度回调，每越过一个进度节点推送一次进度"""
+        notified = 0.0
+
+        def notify(progress: float, remaining: float):
+            nonlocal notified
+            reached = max(
+                (m for m in progress_milestones if notified < m <= progress),
+                default=None,
+            )
+            if reached is None:
                 return
-        # 解析参数
-        msg = re.match(
-            r"^(?:生成视频|视频生成|sora) (横屏|竖屏)?([\s\S]*)$",
-            event.message_str,
+            notified = reached
+            self._spawn(
+                self._send(
+                    session_id,
+                    [
+                        Comp.Reply(id=message_id),
+                        Comp.Plain(
+                            f"视频已生成 {reached * 100:.0f}%，预计还需 {max(1, round(remaining / 60))} 分钟~\nID: {task_id}"
+                        ),
+                    ],
+                )
+            )
+
+        return notify
+
+    async def _finish_duplicate(
+        self, session_id: str, message_id: int | None, task_id: str
+    ):
+        """等待相同请求已有任务的结果并推送回会话，不占用并发"""
+        try:
+            video_url, msg = await self._await_task(task_id)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"任务 {task_id} 处理失败: {e}")
+            await self._send(
+                session_id,
+                [
+                    Comp.Reply(id=message_id),
+                    Comp.Plain(f"任务处理失败，可用 sora查询 {task_id} 重试"),
+                ],
+            )
+            return
+        await self._send(
+            session_id,
+            [Video.fromURL(url=video_url)]
+            if video_url
+            else [Comp.Reply(id=message_id), Comp.Plain(msg)],
         )
-        # 提取提示词
-        prompt = msg.group(2).strip() if msg and msg.group(2) else self.def_prompt
 
+    async def _read_image(
+        self, event: AstrMessageEvent, orientation: str | None
+    ) -> tuple[str, bytes | None, str, str | None]:
+        """获取消息中的第一张图片并确定视频方向，返回 (图片地址, 图片, 方向, 错误)"""
         # 遍历消息链，获取第一张图片
         image_url = ""
         for comp in event.get_messages():
@@ -262,99 +1077,364 @@ class VideoSora(Star):
 
         # 下载图片
         image_bytes = None
+        image_info = None
         if image_url:
-            image_bytes, err = await self.utils.download_image(image_url)
+            image_bytes, image_info, err = await self.utils.download_image(image_url)
             if not image_bytes or err:
+                return image_url, None, "portrait", err
+
+        # 竖屏还是横屏
+        screen_mode = "portrait"
+        if orientation:
+            screen_mode = "landscape" if orientation.strip() == "横屏" else "portrait"
+        elif self.screen_mode in ["横屏", "竖屏"]:
+            screen_mode = "landscape" if self.screen_mode == "横屏" else "portrait"
+        elif self.screen_mode == "自动" and image_info:
+            screen_mode = image_info.orientation
+
+        # 转换格式并按视频方向缩放
+        if image_bytes:
+            image_bytes, err = await self.normalizer.normalize(
+                image_bytes, image_info.width, image_info.height, screen_mode
+            )
+            if err:
+                return image_url, None, screen_mode, err
+        return image_url, image_bytes, screen_mode, None
+
+    @filter.command("sora", alias={"生成视频", "视频生成"})
+    async def video_sora(self, event: AstrMessageEvent):
+        """使用sora模型生成视频"""
+        # 先检测AccessToken是否存在
+        if not self.scheduler.tokens:
+            yield event.chain_result(
+                [
+                    Comp.Reply(id=event.message_obj.message_id),
+                    Comp.Plain("请先在插件配置中添加Authorization"),
+                ]
+            )
+            return
+        if self.white_list_enabled:
+            session_id = event.unified_msg_origin
+            if session_id not in self.white_list:
                 yield event.chain_result(
                     [
                         Comp.Reply(id=event.message_obj.message_id),
-                        Comp.Plain(err),
+                        Comp.Plain("您没有权限使用该插件,请联系管理员添加sid白名单"),
                     ]
                 )
                 return
+        # 解析参数
+        msg = re.match(
+            r"^(?:生成视频|视频生成|sora) (横屏|竖屏)?([\s\S]*)$",
+            event.message_str,
+        )
+        # 提取提示词
+        prompt = msg.group(2).strip() if msg and msg.group(2) else self.def_prompt
 
-        # 竖屏还是横屏
-        screen_mode = "portrait"
-        if msg.group(1):
-            params = msg.group(1).strip()
-            screen_mode = "landscape" if params == "横屏" else "portrait"
-        elif self.screen_mode in ["横屏", "竖屏"]:
-            screen_mode = "landscape" if self.screen_mode == "横屏" else "portrait"
-        elif self.screen_mode == "自动" and image_bytes:
-            screen_mode = self.utils.get_image_orientation(image_bytes)
-
-        # 随机选择一个Authorization
-        valid_tokens = [k for k, v in self.auth_dict.items() if v < 2]
-        if not valid_tokens:
+        image_url, image_bytes, screen_mode, err = await self._read_image(
+            event, msg.group(1)
+        )
+        if err:
             yield event.chain_result(
                 [
                     Comp.Reply(id=event.message_obj.message_id),
-                    Comp.Plain("当前并发数过多，请稍后再试"),
+                    Comp.Plain(err),
                 ]
             )
             return
 
-        task_id = None
-        auth_token = None
-        authorization = None
-        err = None
+        image_hash = UploadCache.digest(image_bytes) if image_bytes else None
+        job = {
+            "session_id": event.unified_msg_origin,
+            "user_id": event.message_obj.sender.user_id,
+            "nickname": event.message_obj.sender.nickname,
+            "message_id": event.message_obj.message_id,
+            "prompt": prompt,
+            "image_url": image_url,
+            "screen_mode": screen_mode,
+            "image_hash": image_hash,
+            "fingerprint": self._fingerprint(prompt, image_hash, screen_mode),
+        }
 
-        # 打乱顺序，避免请求过于集中
-        random.shuffle(valid_tokens)
-        # 尝试循环使用所有可用 token，
-        for auth_token in valid_tokens:
-            authorization = "Bearer " + auth_token
-            # 调用创建视频的函数
-            task_id, err = await self.create_video(
-                event, image_url, image_bytes, prompt, screen_mode, authorization
-            )
-            # 如果成功拿到 task_id，则跳出循环
-            if task_id:
-                # 回复用户
+        # 时间窗口内有相同的请求时，直接等待它的结果
+        if self.dedup_window:
+            duplicate = await self._claim_fingerprint(job["fingerprint"])
+            if duplicate:
+                metrics.inc("sora_requests_total", result="merged")
                 yield event.chain_result(
                     [
                         Comp.Reply(id=event.message_obj.message_id),
-                        Comp.Plain(f"视频正在生成，请稍等~\nID: {task_id}"),
+                        Comp.Plain(
+                            f"相同的视频已经在生成了，完成后会一起发送~\nID: {duplicate}"
+                        ),
                     ]
                 )
-                break
+                self._spawn(
+                    self._finish_duplicate(
+                        event.unified_msg_origin,
+                        event.message_obj.message_id,
+                        duplicate,
+                    )
+                )
+                return
 
-        # 尝试完全部 token 仍然请求失败
+        task_id, auth_token, reply = None, None, None
+        try:
+            # 没有空闲Token，或者已有任务在排队时，进入排队
+            if self.queue_enabled:
+                (has_waiting,) = await self.db.fetchone(
+                    "SELECT EXISTS(SELECT 1 FROM video_queue WHERE status = 'waiting')"
+                )
+                if has_waiting or not self.scheduler.candidates():
+                    position, err = await self._enqueue(job, image_bytes)
+                    metrics.inc(
+                        "sora_requests_total", result="rejected" if err else "queued"
+                    )
+                    reply = (
+                        err
+                        or f"当前并发数过多，已加入排队，前面还有 {position - 1} 个任务，轮到后会自动开始生成~"
+                    )
+            elif not self.scheduler.candidates():
+                reply = (
+                    "今天的额度已用完，请明天再试"
+                    if self.scheduler.out_of_quota()
+                    else "当前并发数过多，请稍后再试"
+                )
+                metrics.inc("sora_requests_total", result="rejected")
+            if not reply:
+                # 尝试循环使用所有可用 token，
+                task_id, auth_token, reply = await self._submit(job, image_bytes)
+                metrics.inc(
+                    "sora_requests_total", result="submitted" if task_id else "failed"
+                )
+        finally:
+            # 排队的任务派发时会重新查找相同请求
+            self._settle_fingerprint(job["fingerprint"], task_id)
+        # 排队，或者尝试完全部 token 仍然请求失败
         if not task_id:
             yield event.chain_result(
                 [
                     Comp.Reply(id=event.message_obj.message_id),
-                    Comp.Plain(err),
+                    Comp.Plain(reply),
                 ]
             )
             return
 
-        try:
-            # 记录并发
-            if self.auth_dict[auth_token] >= self.task_limit:
-                self.auth_dict[auth_token] = self.task_limit
-                logger.warning(f"Token {auth_token[-4:]} 并发数已达上限，但仍尝试使用")
-            else:
-                self.auth_dict[auth_token] += 1
-
-            # 剩下的任务交给quote_task处理
-            video_url, msg = await self.quote_task(event, task_id, authorization)
-            if not video_url:
+        # 回复用户，之后由后台任务等待生成结果并推送回会话
+        self._spawn(
+            self._finish_task(
+                event.unified_msg_origin,
+                event.message_obj.message_id,
+                task_id,
+                auth_token,
+            )
+        )
+        yield event.chain_result(
+            [
+                Comp.Reply(id=event.message_obj.message_id),
+                Comp.Plain(f"视频正在生成，完成后会自动发送~\nID: {task_id}"),
+            ]
+        )
+
+    @filter.command("sora批量")
+    async def video_batch(self, event: AstrMessageEvent):
+        """批量生成视频：每行一个提示词，或者在提示词前指定生成数量"""
+        if not self.scheduler.tokens:
+            yield event.chain_result(
+                [
+                    Comp.Reply(id=event.message_obj.message_id),
+                    Comp.Plain("请先在插件配置中添加Authorization"),
+                ]
+            )
+            return
+        if self.white_list_enabled:
+            session_id = event.unified_msg_origin
+            if session_id not in self.white_list:
                 yield event.chain_result(
                     [
                         Comp.Reply(id=event.message_obj.message_id),
-                        Comp.Plain(msg),
+                        Comp.Plain("您没有权限使用该插件,请联系管理员添加sid白名单"),
                     ]
                 )
                 return
-            yield event.chain_result([Video.fromURL(url=video_url)])
+        # 解析参数：sora批量 [横屏|竖屏] [数量] <提示词，每行一个>
+        msg = re.match(
+            r"^sora批量(?:\s+(横屏|竖屏))?(?:\s+(\d+)(?=\s|$))?\s*([\s\S]*)$",
+            event.message_str,
+        )
+        count = msg.group(2) if msg and msg.group(2) else "1"
+        # 位数过多的数量直接按无效处理，int() 转换超长数字本身也很慢
+        count = int(count) if len(count) <= 4 else 0
+        prompts = [line.strip() for line in (msg.group(3) if msg else "").splitlines()]
+        prompts = [p for p in prompts if p] or [self.def_prompt]
+        # 先检查总数再展开，避免超大数量在事件循环里构造巨大的列表
+        if count < 1 or len(prompts) * count > self.batch_max:
+            yield event.chain_result(
+                [
+                    Comp.Reply(id=event.message_obj.message_id),
+                    Comp.Plain(
+                        f"一次最多生成 {self.batch_max} 个视频，请减少数量或提示词"
+                    ),
+                ]
+            )
+            return
+        prompts = [p for p in prompts for _ in range(count)]
+        if self.scheduler.out_of_quota():
+            yield event.chain_result(
+                [
+                    Comp.Reply(id=event.message_obj.message_id),
+                    Comp.Plain("今天的额度已用完，请明天再试"),
+                ]
+            )
+            return
 
+        image_url, image_bytes, screen_mode, err = await self._read_image(
+            event, msg.group(1) if msg else None
+        )
+        if err:
+            yield event.chain_result(
+                [
+                    Comp.Reply(id=event.message_obj.message_id),
+                    Comp.Plain(err),
+                ]
+            )
+            return
+        image_hash = UploadCache.digest(image_bytes) if image_bytes else None
+        # 同一提示词的多次生成是有意为之，不参与相同请求合并
+        jobs = [
+            {
+                "session_id": event.unified_msg_origin,
+                "user_id": event.message_obj.sender.user_id,
+                "nickname": event.message_obj.sender.nickname,
+                "message_id": event.message_obj.message_id,
+                "prompt": prompt,
+                "image_url": image_url,
+                "screen_mode": screen_mode,
+                "image_hash": image_hash,
+            }
+            for prompt in prompts
+        ]
+        # 批量任务与其他请求一起按顺序排队，结果生成完后合并成一条转发消息推送
+        batch_id = uuid4().hex
+        for i, job in enumerate(jobs):
+            job["batch_key"] = f"{batch_id}:{i}"
+        if self.queue_enabled:
+            collectors, reply = await self._queue_batch(jobs, image_bytes)
+        else:
+            collectors, reply = await self._submit_batch(jobs, image_bytes)
+        if collectors:
+            self._spawn(self._finish_batch(event.get_self_id(), jobs, collectors))
+        yield event.chain_result(
+            [
+                Comp.Reply(id=event.message_obj.message_id),
+                Comp.Plain(reply),
+            ]
+        )
+
+    async def _queue_batch(
+        self, jobs: list[dict], image_bytes: bytes | None
+    ) -> tuple[list[asyncio.Future] | None, str]:
+        """把批量任务按顺序加入排队，返回 (各任务的结果, 回复)，全部入队失败时结果为None"""
+        (waiting,) = await self.db.fetchone(
+            "SELECT COUNT(*) FROM video_queue WHERE status = 'waiting'"
+        )
+        if waiting + len(jobs) > self.queue_max_size:
+            return None, "当前排队任务过多，请稍后再试"
+        collectors = []
+        position, err = None, None
+        for job in jobs:
+            # 先登记再入队，调度器可能在入队后立即派发
+            collector = self.batch_results[job["batch_key"]] = (
+                asyncio.get_running_loop().create_future()
+            )
+            collectors.append(collector)
+            pos, err = await self._enqueue(job, image_bytes)
+            if err:
+                self.batch_results.pop(job["batch_key"], None)
+                collector.set_result((None, None, err))
+            position = position or pos
+        if position is None:
+            return None, err
+        return (
+            collectors,
+            f"开始批量生成 {len(jobs)} 个视频，前面还有 {position - 1} 个任务，全部完成后一起发送~",
+        )
+
+    async def _submit_batch(
+        self, jobs: list[dict], image_bytes: bytes | None
+    ) -> tuple[list[asyncio.Future] | None, str]:
+        """未开启排队时直接提交批量任务，没有空闲并发的任务记为失败，返回值同 _queue_batch"""
+        collectors = []
+        submitted, err = 0, None
+        for job in jobs:
+            collector = asyncio.get_running_loop().create_future()
+            collectors.append(collector)
+            try:
+                task_id, auth_token, err = await self._submit(job, image_bytes)
+            except Exception as e:
+                logger.error(f"批量任务提交失败: {e}")
+                task_id, err = None, "提交任务失败"
+            metrics.inc(
+                "sora_requests_total", result="submitted" if task_id else "failed"
+            )
+            if not task_id:
+                collector.set_result((None, None, err))
+                continue
+            submitted += 1
+            self._spawn(self._collect_batch_job(task_id, auth_token, collector))
+        if not submitted:
+            return None, err
+        return (
+            collectors,
+            f"开始批量生成 {len(jobs)} 个视频，已提交 {submitted} 个，全部完成后一起发送~",
+        )
+
+    async def _collect_batch_job(
+        self, task_id: str, auth_token: str, collector: asyncio.Future
+    ):
+        """等待批量中的一个任务生成完毕，把 (task_id, 视频地址, 错误) 交给 _finish_batch"""
+        video_url, err = None, "批量任务处理失败"
+        try:
+            video_url, err = await self.quote_task(task_id, "Bearer " + auth_token)
+        except Exception as e:
+            logger.error(f"批量任务 {task_id} 处理失败: {e}")
         finally:
-            if self.auth_dict[auth_token] <= 0:
-                self.auth_dict[auth_token] = 0
-                logger.warning(f"Token {auth_token[-4:]} 并发数计算错误，已重置为0")
-            else:
-                self.auth_dict[auth_token] -= 1
+            self._release(auth_token)
+            if not collector.done():
+                collector.set_result((task_id, video_url, err))
+
+    async def _finish_batch(
+        self, self_id: str, jobs: list[dict], collectors: list[asyncio.Future]
+    ):
+        """等待批量中的全部任务，把结果合并成一条转发消息推送回会话"""
+        results = []
+        for job, result in zip(
+            jobs, await asyncio.gather(*collectors, return_exceptions=True)
+        ):
+            if isinstance(result, BaseException):
+                logger.error(f"批量任务 {job['batch_key']} 处理失败: {result}")
+                result = (None, None, "批量任务处理失败")
+            results.append(result)
+        done = sum(1 for _, video_url, _ in results if video_url)
+        nodes = [
+            Comp.Node(
+                uin=self_id,
+                name="Sora",
+                content=[Comp.Plain(f"批量生成完成：成功 {done}/{len(jobs)} 个")],
+            )
+        ]
+        for i, (job, (task_id, video_url, err)) in enumerate(zip(jobs, results), 1):
+            title = f"{i}. {job['prompt']}" + (f"\nID: {task_id}" if task_id else "")
+            nodes.append(
+                Comp.Node(
+                    uin=self_id,
+                    name="Sora",
+                    content=[Comp.Plain(title), Video.fromURL(url=video_url)]
+                    if video_url
+                    else [Comp.Plain(f"{title}\n{err}")],
+                )
+            )
+        await self._send(jobs[0]["session_id"], [Comp.Nodes(nodes)])
 
     @filter.command("sora查询")
     async def check_video_task(self, event: AstrMessageEvent, task_id: str):
@@ -369,11 +1449,15 @@ class VideoSora(Star):
                     ]
                 )
                 return
-        await self.cursor.execute(
-            "SELECT status, video_url, error_msg, auth_xor FROM video_data WHERE task_id = ?",
+        async for result in self._replay_task(event, task_id):
+            yield result
+
+    async def _replay_task(self, event: AstrMessageEvent, task_id: str):
+        """重放或继续完成单个任务"""
+        row = await self.db.fetchone(
+            "SELECT status, video_url, generation_id, url_expires_at, error_msg, auth_xor FROM video_data WHERE task_id = ?",
             (task_id,),
         )
-        row = await self.cursor.fetchone()
         if not row:
             yield event.chain_result(
                 [
@@ -382,7 +1466,7 @@ class VideoSora(Star):
                 ]
             )
             return
-        status, video_url, error_msg, auth_xor = row
+        status, video_url, generation_id, expires_at, error_msg, auth_xor = row
         # 先处理错误
         if status == "Failed":
             yield event.chain_result(
@@ -392,20 +1476,33 @@ class VideoSora(Star):
                 ]
             )
             return
-        # 有视频，直接发送视频
+        # 有视频，优先发送本地缓存，其次确认下载地址没有过期
         if video_url:
-            if self.speed_down_url:
-                video_url = self.speed_down_url + video_url
-            yield event.chain_result([Video.fromURL(url=video_url)])
+            local_path = (
+                self.video_cache.get(generation_id)
+                if self.video_cache and generation_id
+                else None
+            )
+            if local_path:
+                yield event.chain_result([Video.fromFileSystem(local_path)])
+                return
+            video_url, err = await self._fresh_url(
+                task_id, video_url, generation_id, expires_at, auth_xor
+            )
+            if not video_url:
+                yield event.chain_result(
+                    [
+                        Comp.Reply(id=event.message_obj.message_id),
+                        Comp.Plain(err),
+                    ]
+                )
+                return
+            yield event.chain_result([await self._video(video_url, generation_id)])
             return
-        # 再次尝试完成视频生成
-        if status == "Queued" or status == "Timeout" or status == "EXCEPTION":
+        # 再次尝试完成视频生成，Done 表示已离开排队列表但还没拿到下载地址
+        if status in ("Queued", "Done", "Timeout", "EXCEPTION"):
             # 尝试匹配auth_token
-            auth_token = None
-            for token in self.auth_dict.keys():
-                if token.endswith(auth_xor):
-                    auth_token = token
-                    break
+            auth_token = self.scheduler.find(auth_xor)
             if not auth_token:
                 yield event.chain_result(
                     [
@@ -414,24 +1511,260 @@ class VideoSora(Star):
                     ]
                 )
                 return
-            # 交给quote_task处理
-            authorization = "Bearer " + auth_token
-            video_url, msg = await self.quote_task(
-                event, task_id, authorization, is_check=True
+            # 任务已在轮询中时直接使用轮询到的进度，不再请求上游
+            status, err, progress = await self.poller.query(
+                task_id, "Bearer " + auth_token
             )
-            if not video_url:
+            if err:
                 yield event.chain_result(
                     [
                         Comp.Reply(id=event.message_obj.message_id),
-                        Comp.Plain(msg),
+                        Comp.Plain(err),
                     ]
                 )
                 return
-            yield event.chain_result([Video.fromURL(url=video_url)])
+            # 由后台任务等待结果并推送回会话；并发在提交或恢复任务时已经占用
+            self._spawn(
+                self._finish_task(
+                    event.unified_msg_origin,
+                    event.message_obj.message_id,
+                    task_id,
+                    auth_token,
+                    is_check=True,
+                    release=False,
+                )
+            )
+            yield event.chain_result(
+                [
+                    Comp.Reply(id=event.message_obj.message_id),
+                    Comp.Plain(
+                        f"任务还在队列中，完成后会自动发送~\n状态：{status} 进度: {progress * 100:.2f}%"
+                        if status != "Done"
+                        else "任务已生成完毕，正在获取视频，稍后自动发送~"
+                    ),
+                ]
+            )
+            return
+        # 未知状态也要回复，不能让用户收不到任何消息
+        yield event.chain_result(
+            [
+                Comp.Reply(id=event.message_obj.message_id),
+                Comp.Plain(
+                    f"任务状态异常：{status or '未知'}"
+                    + (f"\n{error_msg}" if error_msg else "")
+                ),
+            ]
+        )
+
+    @filter.command("sora历史")
+    async def video_history(self, event: AstrMessageEvent):
+        """查看自己最近的视频任务，可按状态筛选、翻页以及重放"""
+        if self.white_list_enabled:
+            session_id = event.unified_msg_origin
+            if session_id not in self.white_list:
+                yield event.chain_result(
+                    [
+                        Comp.Reply(id=event.message_obj.message_id),
+                        Comp.Plain("您没有权限使用该插件,请联系管理员添加sid白名单"),
+                    ]
+                )
+                return
+        user_id = event.message_obj.sender.user_id
+        cache_key = f"{event.unified_msg_origin}:{user_id}"
+        args = event.message_str.split()[1:]
+
+        # 重放上一次列表中的任务
+        if args and args[0] == "重放":
+            listed = self.history_cache.get(cache_key, [])
+            index = int(args[1]) if len(args) > 1 and args[1].isdigit() else 0
+            if not 1 <= index <= len(listed):
+                yield event.chain_result(
+                    [
+                        Comp.Reply(id=event.message_obj.message_id),
+                        Comp.Plain("请先发送 sora历史 查看任务列表，再按序号重放"),
+                    ]
+                )
+                return
+            async for result in self._replay_task(event, listed[index - 1]):
+                yield result
+            return
+
+        # 解析状态筛选和翻页游标
+        status = None
+        if args and (args[0] in history_status or args[0] in history_status.values()):
+            status = history_status.get(args[0], args[0])
+            args = args[1:]
+        cursor = args[0] if args else None
+
+        # 按 (user_id, created_at) 索引做游标分页，不使用 OFFSET
+        conditions = ["user_id = ?"]
+        params = [user_id]
+        if status:
+            conditions.append("status = ?")
+            params.append(status)
+        if cursor:
+            row = await self.db.fetchone(
+                "SELECT created_at FROM video_data WHERE task_id = ? AND user_id = ?",
+                (cursor, user_id),
+            )
+            if not row:
+                yield event.chain_result(
+                    [
+                        Comp.Reply(id=event.message_obj.message_id),
+                        Comp.Plain("翻页参数无效"),
+                    ]
+                )
+                return
+            # 行值比较才能沿 (user_id, created_at, task_id) 索引直接定位到上一页末尾
+            conditions.append("(created_at, task_id) < (?, ?)")
+            params.extend([row[0], cursor])
+        rows = await self.db.fetchall(
+            f"""
+            SELECT task_id, prompt, status, created_at FROM video_data
+            WHERE {" AND ".join(conditions)}
+            ORDER BY created_at DESC, task_id DESC LIMIT ?
+            """,
+            (*params, history_page_size + 1),
+        )
+        if not rows:
+            yield event.chain_result(
+                [
+                    Comp.Reply(id=event.message_obj.message_id),
+                    Comp.Plain("没有找到视频任务"),
+                ]
+            )
+            return
+
+        has_more = len(rows) > history_page_size
+        rows = rows[:history_page_size]
+        self.history_cache[cache_key] = [row[0] for row in rows]
+        self.history_cache.move_to_end(cache_key)
+        while len(self.history_cache) > history_cache_size:
+            self.history_cache.popitem(last=False)
+
+        status_names = {v: k for k, v in history_status.items()}
+        lines = ["最近的视频任务："]
+        for i, (task_id, prompt, task_status, created_at) in enumerate(rows, 1):
+            prompt = prompt or ""
+            if len(prompt) > 20:
+                prompt = prompt[:20] + "…"
+            lines.append(
+                f"{i}. [{status_names.get(task_status, task_status)}] {created_at} {prompt}\n   ID: {task_id}"
+            )
+        lines.append("发送「sora历史 重放 序号」可重放对应任务")
+        if has_more:
+            status_arg = f"{status_names[status]} " if status else ""
+            lines.append(f"下一页：sora历史 {status_arg}{rows[-1][0]}")
+        yield event.chain_result(
+            [
+                Comp.Reply(id=event.message_obj.message_id),
+                Comp.Plain("\n".join(lines)),
+            ]
+        )
+
+    @filter.permission_type(filter.PermissionType.ADMIN)
+    @filter.command("sora指标")
+    async def video_metrics(self, event: AstrMessageEvent):
+        """查看上游接口耗时、失败率以及各Token的负载（管理员）"""
+        lines = ["上游接口："]
+        lines += metrics.endpoint_summary() or ["暂无请求"]
+        lines.append("Token：")
+        now = time.monotonic()
+        for token in self.scheduler.tokens:
+            stats = self.scheduler.stats[token]
+            line = f"…{token[-4:]}: 并发 {stats.active}/{self.task_limit}"
+            if stats.remote:
+                line += f"(其他实例 {stats.remote})"
+            line += (
+                f" 错误率 {self.scheduler.error_rate(token) * 100:.0f}%"
+                f" 提交耗时 {stats.latency:.1f}s"
+            )
+            if stats.exhausted_until > now:
+                line += f" 额度用尽({(stats.exhausted_until - now) / 60:.0f}分钟后恢复)"
+            if stats.cooldown_until > now:
+                line += f" 冷却中({stats.cooldown_until - now:.0f}s)"
+            lines.append(line)
+        (waiting,) = await self.db.fetchone(
+            "SELECT COUNT(*) FROM video_queue WHERE status = 'waiting'"
+        )
+        lines.append(f"排队中 {waiting} 个，生成中 {len(self.inflight)} 个")
+        lines.append("连接池：")
+        for host, stats in self.utils.pool.snapshot().items():
+            lines.append(
+                f"{host}: 请求 {stats['requests']} 失败 {stats['errors']}"
+                f" 并发 {stats['active']}/{self.utils.pool.max_clients} 峰值 {stats['peak']}"
+                f" 排队 {stats['waited']}"
+            )
+        yield event.chain_result(
+            [
+                Comp.Reply(id=event.message_obj.message_id),
+                Comp.Plain("\n".join(lines)),
+            ]
+        )
+
+    @filter.permission_type(filter.PermissionType.ADMIN)
+    @filter.command("sora额度")
+    async def video_quota(self, event: AstrMessageEvent):
+        """查看各Token今天的用量和整个Token池的剩余额度（管理员）"""
+        daily_quota = self.usage.daily_quota
+        lines = [f"今日（{self.usage.day}）用量："]
+        total_used = 0
+        total_remaining = 0
+        available = 0
+        for token in self.scheduler.tokens:
+            used = self.usage.used_today(token)
+            remaining = self.usage.remaining(token)
+            total_used += used
+            line = f"…{token[-4:]}: 已提交 {used}"
+            if remaining is not None:
+                line += f"/{daily_quota} 剩余 {remaining}"
+            exhausted = self.usage.exhausted_for(token)
+            if exhausted:
+                line += f" 额度用尽({exhausted / 60:.0f}分钟后恢复)"
+            elif remaining != 0:
+                available += 1
+                total_remaining += remaining or 0
+            lines.append(line)
+        lines.append(
+            f"合计已提交 {total_used} 个，可用Token {available}/{len(self.scheduler.tokens)} 个"
+        )
+        if daily_quota:
+            lines.append(f"今天还可以生成约 {total_remaining} 个视频")
+        else:
+            lines.append("未配置每日额度（daily_quota），无法估算剩余额度")
+        yield event.chain_result(
+            [
+                Comp.Reply(id=event.message_obj.message_id),
+                Comp.Plain("\n".join(lines)),
+            ]
+        )
 
     async def terminate(self):
         """可选择实现异步的插件销毁方法，当插件被卸载/停用时会调用。"""
+        # 停止派发新任务
+        self.dispatcher.cancel()
+        metrics.collectors.remove(self._collect_metrics)
+        if self.metrics_server:
+            self.metrics_server.close()
+        # 保存轮询进度，未完成的任务保持原状态，下次启动时自动恢复
+        datetime_now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        await self.db.executemany(
+            "UPDATE video_data SET progress = ?, updated_at = ? WHERE task_id = ?",
+            [
+                (progress, datetime_now, task_id)
+                for task_id, progress in self.poller.snapshot().items()
+            ],
+        )
+        for task in list(self.background_tasks):
+            task.cancel()
+        await asyncio.gather(
+            self.dispatcher, *self.background_tasks, return_exceptions=True
+        )
+        await self.poller.close()
+        if self.scheduler.leases:
+            await self.scheduler.leases.close()
+        if self.video_cache:
+            await self.video_cache.close()
+        self.normalizer.close()
         await self.utils.close()
-        await self.conn.commit()
-        await self.cursor.close()
-        await self.conn.close()
+        await self.db.close()
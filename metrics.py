@@ -0,0 +1,231 @@
+import time
+import asyncio
+import inspect
+import functools
+from bisect import bisect_left
+from typing import Awaitable, Callable
+from astrbot.api import logger
+
+# 直方图分桶（秒）
+latency_buckets = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+duration_buckets = (30, 60, 120, 180, 300, 450, 600, 900, 1200)
+
+Labels = tuple[tuple[str, str], ...]
+Sample = tuple[str, dict[str, str], float]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class _Histogram:
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # 最后一个为 +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """按分桶上界估算分位数"""
+        target = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= target:
+                return bound
+        return float("inf")
+
+
+class Metrics:
+    """进程内的指标注册表，包含计数器、仪表和耗时直方图"""
+
+    def __init__(self):
+        self.counters: dict[tuple[str, Labels], float] = {}
+        self.gauges: dict[tuple[str, Labels], float] = {}
+        self.histograms: dict[tuple[str, Labels], _Histogram] = {}
+        # 导出时才计算的仪表，例如Token并发和排队长度
+        self.collectors: list[Callable[[], Awaitable[list[Sample]]]] = []
+
+    @staticmethod
+    def _key(name: str, labels: dict) -> tuple[str, Labels]:
+        return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = self._key(name, labels)
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels):
+        self.gauges[self._key(name, labels)] = value
+
+    def observe(
+        self, name: str, value: float, buckets: tuple = latency_buckets, **labels
+    ):
+        key = self._key(name, labels)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = _Histogram(buckets)
+        histogram.observe(value)
+
+    def timed(self, endpoint: str):
+        """统计上游请求的次数、失败数和耗时
+
+        被装饰的方法返回元组时以最后一个元素作为错误信息；有 authorization 参数时按Token后缀分别统计
+        """
+
+        def decorator(func):
+            signature = inspect.signature(func)
+
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                authorization = signature.bind_partial(*args, **kwargs).arguments.get(
+                    "authorization"
+                )
+                token = authorization[-4:] if authorization else ""
+                start = time.monotonic()
+                result = "error"
+                try:
+                    value = await func(*args, **kwargs)
+                    if not isinstance(value, tuple) or value[-1] is None:
+                        result = "ok"
+                    return value
+                finally:
+                    self.inc(
+                        "sora_upstream_requests_total",
+                        endpoint=endpoint,
+                        token=token,
+                        result=result,
+                    )
+                    self.observe(
+                        "sora_upstream_latency_seconds",
+                        time.monotonic() - start,
+                        endpoint=endpoint,
+                        token=token,
+                    )
+
+            return wrapper
+
+        return decorator
+
+    async def collect(self) -> list[Sample]:
+        samples = []
+        for collector in self.collectors:
+            try:
+                samples.extend(await collector())
+            except Exception as e:
+                logger.error(f"采集指标失败: {e}")
+        return samples
+
+    async def render(self) -> str:
+        """导出为 Prometheus 文本格式"""
+        lines = []
+        typed = set()
+
+        def header(name: str, kind: str):
+            if name in typed:
+                return
+            typed.add(name)
+            lines.append(f"# TYPE {name} {kind}")
+
+        def fmt(labels) -> str:
+            if not labels:
+                return ""
+            return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels) + "}"
+
+        for (name, labels), value in sorted(self.counters.items()):
+            header(name, "counter")
+            lines.append(f"{name}{fmt(labels)} {value:g}")
+        gauges = dict(self.gauges)
+        for name, labels, value in await self.collect():
+            gauges[self._key(name, labels)] = value
+        for (name, labels), value in sorted(gauges.items()):
+            header(name, "gauge")
+            lines.append(f"{name}{fmt(labels)} {value:g}")
+        for (name, labels), histogram in sorted(self.histograms.items()):
+            header(name, "histogram")
+            cumulative = 0
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                cumulative += count
+                lines.append(
+                    f"{name}_bucket{fmt(labels + (('le', f'{bound:g}'),))} {cumulative}"
+                )
+            lines.append(
+                f"{name}_bucket{fmt(labels + (('le', '+Inf'),))} {histogram.count}"
+            )
+            lines.append(f"{name}_sum{fmt(labels)} {histogram.sum:g}")
+            lines.append(f"{name}_count{fmt(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def endpoint_summary(self) -> list[str]:
+        """按接口汇总请求数、失败率和耗时，用于管理员命令"""
+        stats: dict[str, list] = {}
+        for (name, labels), value in self.counters.items():
+            if name != "sora_upstream_requests_total":
+                continue
+            labels = dict(labels)
+            total = stats.setdefault(labels["endpoint"], [0, 0, None])
+            total[0] += value
+            if labels["result"] == "error":
+                total[1] += value
+        for (name, labels), histogram in self.histograms.items():
+            if name != "sora_upstream_latency_seconds":
+                continue
+            endpoint = dict(labels)["endpoint"]
+            merged = stats.setdefault(endpoint, [0, 0, None])
+            if merged[2] is None:
+                merged[2] = _Histogram(histogram.buckets)
+            for i, count in enumerate(histogram.counts):
+                merged[2].counts[i] += count
+            merged[2].sum += histogram.sum
+            merged[2].count += histogram.count
+        lines = []
+        for endpoint, (total, errors, histogram) in sorted(stats.items()):
+            line = f"{endpoint}: {total:g}次 失败{errors / total * 100 if total else 0:.1f}%"
+            if histogram and histogram.count:
+                line += (
+                    f" 平均{histogram.sum / histogram.count:.2f}s"
+                    f" P50≤{histogram.quantile(0.5):g}s P99≤{histogram.quantile(0.99):g}s"
+                )
+            lines.append(line)
+        return lines
+
+
+metrics = Metrics()
+
+
+async def serve(host: str, port: int) -> asyncio.AbstractServer:
+    """启动只提供 /metrics 的简易HTTP服务"""
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), 5)
+            # 读完请求头
+            while (await asyncio.wait_for(reader.readline(), 5)) not in (
+                b"\r\n",
+                b"\n",
+                b"",
+            ):
+                pass
+            parts = request_line.decode(errors="ignore").split()
+            if len(parts) >= 2 and parts[0] == "GET" and parts[1] == "/metrics":
+                status, body = "200 OK", (await metrics.render()).encode()
+            else:
+                status, body = "404 Not Found", b"not found\n"
+            writer.write(
+                f"HTTP/1.1 {status}\r\n"
+                "Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                "Connection: close\r\n\r\n".encode()
+                + body
+            )
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, host, port)
@@ -0,0 +1,282 @@
+import time
+import asyncio
+from typing import Callable
+from astrbot.api import logger
+from .utils import Utils
+
+# 轮询参数
+max_interval = 60  # 最大间隔
+min_interval = 5  # 最小间隔
+total_wait = 360  # 最短等待时间，预计耗时更长时按预测延长
+max_total_wait = 1800  # 最长等待30分钟
+deadline_factor = 2.0  # 等待上限为预计总耗时的倍数
+default_duration = 180  # 没有历史数据时假定的生成耗时
+ewma_alpha = 0.2  # 历史耗时的平滑系数
+
+
+class _Waiter:
+    """单个任务的轮询进度"""
+
+    def __init__(self, task_id: str, progress: float | None = None):
+        now = time.monotonic()
+        self.task_id = task_id
+        self.future = asyncio.get_running_loop().create_future()
+        self.status = None
+        self.progress = progress or 0
+        self.started = now
+        # 首次查询到的 (时间, 进度)；恢复的任务以保存的进度为起点
+        self.first: tuple[float, float] | None = (now, progress) if progress else None
+        self.next_at = now  # 首次立即查询
+        self.deadline = now + total_wait
+
+    def observe(self, progress: float, now: float):
+        self.progress = progress
+        if self.first is None:
+            self.first = (now, progress)
+
+    def remaining(self, expected: float, now: float) -> float:
+        """预计剩余秒数：按历史平均耗时和本任务的进度速度加权估算，进度越高越相信速度"""
+        elapsed = now - self.started
+        # 恢复的任务开始时间未知，用进度推算
+        by_history = min(expected - elapsed, expected * (1 - self.progress))
+        t0, p0 = self.first or (now, self.progress)
+        if self.progress <= p0 or now <= t0:
+            return max(0.0, by_history)
+        rate = (self.progress - p0) / (now - t0)
+        by_rate = (1 - self.progress) / rate
+        weight = self.progress
+        return max(0.0, weight * by_rate + (1 - weight) * by_history)
+
+
+class _TokenState:
+    """单个Token的共享轮询状态"""
+
+    def __init__(self):
+        self.waiters: dict[str, _Waiter] = {}
+        self.tasks: dict[str, tuple[str | None, float]] = {}  # 最近一次的排队列表
+        self.fetching: asyncio.Future | None = None  # 正在进行的列表请求
+        self.wakeup = asyncio.Event()
+        self.worker: asyncio.Task | None = None
+
+
+class PendingPoller:
+    """按Token共享的排队列表轮询器，每个Token只跑一个轮询循环，结果分发给所有等待的任务"""
+
+    def __init__(self, utils: Utils):
+        self.utils = utils
+        self.states: dict[str, _TokenState] = {}
+        self.expected: float = default_duration  # 平滑后的历史生成耗时
+        self.resumed: dict[str, float] = {}  # 重启前保存的进度，开始等待时取出
+        # task_id -> 进度回调，参数为 (进度, 预计剩余秒数)
+        self.listeners: dict[str, list[Callable[[float, float], None]]] = {}
+
+    def observe(self, duration: float):
+        """记录一次完整的生成耗时"""
+        if 0 < duration <= max_total_wait:
+            self.expected += ewma_alpha * (duration - self.expected)
+
+    def listen(
+        self, task_id: str, callback: Callable[[float, float], None]
+    ) -> Callable[[], None]:
+        """订阅任务的进度，每次查询到进度时调用，返回取消订阅的函数"""
+        self.listeners.setdefault(task_id, []).append(callback)
+
+        def cancel():
+            callbacks = self.listeners.get(task_id, [])
+            if callback in callbacks:
+                callbacks.remove(callback)
+            if not callbacks:
+                self.listeners.pop(task_id, None)
+
+        return cancel
+
+    def resume(self, task_id: str, progress: float):
+        """登记重启前保存的进度，等待该任务时用作预测的起点"""
+        if progress:
+            self.resumed[task_id] = progress
+
+    def _get_state(self, authorization: str) -> _TokenState:
+        state = self.states.get(authorization)
+        if state is None:
+            state = self.states[authorization] = _TokenState()
+        return state
+
+    async def _refresh(
+        self, authorization: str, state: _TokenState
+    ) -> tuple[dict[str, tuple[str | None, float]] | None, str | None, str | None]:
+        """拉取一次排队列表，同一时刻的并发调用共享同一个请求"""
+        if state.fetching is None:
+            state.fetching = asyncio.ensure_future(
+                self.utils.fetch_pending(authorization)
+            )
+            state.fetching.add_done_callback(lambda _: setattr(state, "fetching", None))
+        tasks, status, err = await asyncio.shield(state.fetching)
+        if tasks is not None:
+            state.tasks = tasks
+        return tasks, status, err
+
+    async def query(
+        self, task_id: str, authorization: str
+    ) -> tuple[str | None, str | None, float]:
+        """查询单个任务的当前状态，返回 (状态, 错误信息, 进度)"""
+        state = self._get_state(authorization)
+        # 任务已在轮询中，直接使用最近一次的轮询结果
+        waiter = state.waiters.get(task_id)
+        if waiter and waiter.status:
+            return waiter.status, None, waiter.progress
+        tasks, status, err = await self._refresh(authorization, state)
+        if tasks is None:
+            return status, err, 0
+        if task_id in tasks:
+            status, progress = tasks[task_id]
+            return status, None, progress
+        return "Done", None, 0  # 任务不存在，视为完成
+
+    async def wait(self, task_id: str, authorization: str) -> tuple[str, str | None]:
+        """订阅任务状态，等待任务离开排队列表"""
+        state = self._get_state(authorization)
+        waiter = state.waiters.get(task_id)
+        if waiter is None:
+            waiter = state.waiters[task_id] = _Waiter(
+                task_id, self.resumed.pop(task_id, None)
+            )
+            state.wakeup.set()
+            if state.worker is None or state.worker.done():
+                state.worker = asyncio.create_task(self._run(authorization, state))
+        return await asyncio.shield(waiter.future)
+
+    async def _run(self, authorization: str, state: _TokenState):
+        """单个Token的轮询循环，没有等待者时自动退出"""
+        try:
+            while state.waiters:
+                now = time.monotonic()
+                next_at = min(w.next_at for w in state.waiters.values())
+                if next_at > now:
+                    # 等到最近一个任务到期，或者有新任务加入
+                    state.wakeup.clear()
+                    try:
+                        await asyncio.wait_for(state.wakeup.wait(), next_at - now)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                tasks, status, err = await self._refresh(authorization, state)
+                now = time.monotonic()
+                backoff = 0.0
+                if status == "Throttled":
+                    backoff = self.utils.resilience.retry_after(
+                        "fetch_pending", authorization
+                    )
+                for waiter in list(state.waiters.values()):
+                    self._dispatch(state, waiter, tasks, status, err, now, backoff)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"视频状态轮询异常: {e}")
+            for waiter in list(state.waiters.values()):
+                self._resolve(
+                    state,
+                    waiter,
+                    "EXCEPTION",
+                    f"视频状态查询异常，ID: {waiter.task_id}，进度: {waiter.progress * 100:.2f}%",
+                )
+
+    def _dispatch(
+        self,
+        state: _TokenState,
+        waiter: _Waiter,
+        tasks: dict[str, tuple[str | None, float]] | None,
+        status: str | None,
+        err: str | None,
+        now: float,
+        backoff: float = 0.0,
+    ):
+        """把一次列表结果分发给单个等待者"""
+        due = now >= waiter.next_at
+        if tasks is None:
+            # 请求失败只影响本轮到期的任务，其余任务照常等待下一轮
+            if not due:
+                return
+            if status == "Throttled" and now < waiter.deadline:
+                # 被限流或上游暂时故障，按 Retry-After 推迟查询，不判定任务失败
+                waiter.next_at = min(now + max(min_interval, backoff), waiter.deadline)
+                logger.debug(f"{err}，{waiter.next_at - now:.0f}s 后再次请求")
+                return
+            if status == "Failed":
+                self._resolve(
+                    state,
+                    waiter,
+                    "Failed",
+                    f"视频状态查询失败，ID: {waiter.task_id}，进度: {waiter.progress * 100:.2f}%，错误: {err}",
+                )
+            else:
+                self._resolve(
+                    state,
+                    waiter,
+                    "EXCEPTION",
+                    f"视频状态查询异常，ID: {waiter.task_id}，进度: {waiter.progress * 100:.2f}%",
+                )
+            return
+        if waiter.task_id not in tasks:
+            # 从提交后开始跟踪的任务才计入历史耗时
+            if waiter.first and waiter.first[1] <= 0.01:
+                self.observe(now - waiter.started)
+            self._resolve(state, waiter, "Done", None)  # 任务不存在，视为完成
+            return
+        waiter.status, progress = tasks[waiter.task_id]
+        waiter.observe(progress, now)
+        if not due:
+            return
+        # 按预测的总耗时调整等待上限
+        remaining = waiter.remaining(self.expected, now)
+        for callback in self.listeners.get(waiter.task_id, ()):
+            try:
+                callback(waiter.progress, remaining)
+            except Exception as e:
+                logger.error(f"进度回调失败: {e}")
+        elapsed = now - waiter.started
+        waiter.deadline = waiter.started + min(
+            max_total_wait,
+            max(total_wait, deadline_factor * (elapsed + remaining)),
+        )
+        if now >= waiter.deadline:
+            logger.error("视频状态查询超时")
+            self._resolve(
+                state,
+                waiter,
+                "Timeout",
+                f"视频状态查询超时，ID: {waiter.task_id}，生成进度: {waiter.progress * 100:.2f}%",
+            )
+            return
+        # 离完成还远时隔一半剩余时间再校准一次预测，快完成时直接约在预计完成的时刻
+        delay = remaining if remaining <= max_interval else remaining / 2
+        delay = min(max_interval, max(min_interval, delay))
+        waiter.next_at = min(now + delay, waiter.deadline)
+        logger.debug(
+            f"视频处理中，预计还需 {remaining:.0f}s，{waiter.next_at - now:.0f}s 后再次请求... 进度: {waiter.progress * 100:.2f}%"
+        )
+
+    def _resolve(
+        self, state: _TokenState, waiter: _Waiter, status: str, err: str | None
+    ):
+        state.waiters.pop(waiter.task_id, None)
+        if not waiter.future.done():
+            waiter.future.set_result((status, err))
+
+    def snapshot(self) -> dict[str, float]:
+        """返回所有轮询中任务的最新进度"""
+        return {
+            task_id: waiter.progress
+            for state in self.states.values()
+            for task_id, waiter in state.waiters.items()
+        }
+
+    async def close(self):
+        """停止所有轮询循环"""
+        for state in self.states.values():
+            if state.worker and not state.worker.done():
+                state.worker.cancel()
+            for waiter in state.waiters.values():
+                waiter.future.cancel()
+            state.waiters.clear()
+        workers = [s.worker for s in self.states.values() if s.worker]
+        await asyncio.gather(*workers, return_exceptions=True)
@@ -0,0 +1,185 @@
+import math
+import time
+import asyncio
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from astrbot.api import logger
+from .metrics import metrics
+
+# 每个 (接口, Token) 的令牌桶参数：(每秒补充的令牌数, 桶容量)
+# 容量不小于单个Token的并发上限，正常的突发请求只排队不失败
+endpoint_rates = {
+    "upload_images": (1.0, 5),
+    "get_sentinel": (5.0, 10),  # 不区分Token
+    "create_video": (0.5, 5),
+    "fetch_pending": (1.0, 3),
+    "fetch_drafts": (1.0, 5),
+    "fetch_generation_url": (1.0, 5),
+}
+default_rate = (1.0, 5)
+max_queue_wait = 30  # 排队等待令牌超过该时间（秒）时直接失败
+# 熔断参数
+failure_threshold = 5  # 连续失败多少次后熔断
+open_seconds = 30  # 首次熔断时长（秒），再次熔断时翻倍
+max_open_seconds = 600  # 熔断时长上限（秒）
+
+
+class Throttled(Exception):
+    """请求被本地限流或熔断拦截，没有发送到上游"""
+
+    def __init__(self, retry_after: float):
+        self.retry_after = retry_after
+        super().__init__(f"请求过于频繁，请 {math.ceil(retry_after)} 秒后再试")
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    """解析 Retry-After 响应头，支持秒数和HTTP日期两种格式"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+class _TokenBucket:
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0  # 上游要求的 Retry-After
+
+    def reserve(self, now: float) -> float:
+        """预定一个令牌，返回需要等待的秒数；令牌可以透支，透支部分按补充速度排队"""
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        return max(0.0, -self.tokens / self.rate, self.blocked_until - now)
+
+    def cancel(self):
+        self.tokens += 1
+
+
+class _CircuitBreaker:
+    def __init__(self):
+        self.failures = 0  # 连续失败次数
+        self.trips = 0  # 连续熔断次数
+        self.open_until = 0.0
+
+    def check(self, now: float) -> float:
+        """返回还需熔断的秒数，0 表示放行"""
+        if self.failures < failure_threshold:
+            return 0.0
+        if now < self.open_until:
+            return self.open_until - now
+        # 半开：放行一个试探请求，试探结束前其余请求继续熔断
+        self.open_until = now + open_seconds
+        return 0.0
+
+    def success(self):
+        self.failures = 0
+        self.trips = 0
+
+    def failure(self, now: float, retry_after: float | None) -> bool:
+        """记录一次失败，返回是否因此熔断"""
+        self.failures += 1
+        if self.failures < failure_threshold:
+            return False
+        seconds = min(max_open_seconds, open_seconds * 2**self.trips)
+        self.trips += 1
+        self.open_until = now + max(seconds, retry_after or 0)
+        return True
+
+
+class Resilience:
+    """按 (接口, Token) 限流和熔断，避免上游故障时反复重试导致账号被风控"""
+
+    def __init__(self):
+        self.buckets: dict[tuple[str, str], _TokenBucket] = {}
+        self.breakers: dict[tuple[str, str], _CircuitBreaker] = {}
+
+    def _bucket(self, key: tuple[str, str]) -> _TokenBucket:
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = _TokenBucket(
+                *endpoint_rates.get(key[0], default_rate)
+            )
+        return bucket
+
+    def _breaker(self, key: tuple[str, str]) -> _CircuitBreaker:
+        breaker = self.breakers.get(key)
+        if breaker is None:
+            breaker = self.breakers[key] = _CircuitBreaker()
+        return breaker
+
+    async def acquire(self, endpoint: str, token: str):
+        """等待发送许可，熔断中或需要等待太久时抛出 Throttled"""
+        key = (endpoint, token)
+        now = time.monotonic()
+        wait = self._breaker(key).check(now)
+        if wait:
+            metrics.inc(
+                "sora_upstream_throttled_total",
+                endpoint=endpoint,
+                token=token[-4:],
+                reason="circuit",
+            )
+            raise Throttled(wait)
+        bucket = self._bucket(key)
+        wait = bucket.reserve(now)
+        if wait > max_queue_wait:
+            bucket.cancel()
+            metrics.inc(
+                "sora_upstream_throttled_total",
+                endpoint=endpoint,
+                token=token[-4:],
+                reason="rate",
+            )
+            raise Throttled(wait)
+        if wait:
+            await asyncio.sleep(wait)
+
+    def record(
+        self,
+        endpoint: str,
+        token: str,
+        status_code: int | None,
+        retry_after: str | None = None,
+    ):
+        """记录一次请求结果，status_code 为None表示网络异常"""
+        key = (endpoint, token)
+        now = time.monotonic()
+        breaker = self._breaker(key)
+        # 4xx 说明上游正常响应，只有429、5xx和网络异常计入熔断
+        if status_code is not None and status_code < 500 and status_code != 429:
+            breaker.success()
+            return
+        seconds = parse_retry_after(retry_after)
+        if status_code == 429:
+            bucket = self._bucket(key)
+            bucket.blocked_until = max(bucket.blocked_until, now + (seconds or 1))
+        if breaker.failure(now, seconds):
+            logger.warning(
+                f"接口 {endpoint} 连续失败，Token {token[-4:] or '-'} 熔断 {breaker.open_until - now:.0f}s"
+            )
+
+    def retry_after(self, endpoint: str, token: str) -> float:
+        """距离可以再次请求还需要的秒数"""
+        key = (endpoint, token)
+        now = time.monotonic()
+        waits = [0.0]
+        breaker = self.breakers.get(key)
+        if breaker and breaker.failures >= failure_threshold:
+            waits.append(breaker.open_until - now)
+        bucket = self.buckets.get(key)
+        if bucket:
+            waits.append(bucket.blocked_until - now)
+        return max(waits)
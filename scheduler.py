@@ -0,0 +1,233 @@
+import time
+import random
+from collections import deque
+from astrbot.api import logger
+from .usage import UsageLedger
+from .leases import LeaseStore
+
+# 调度参数
+error_window = 300  # 统计错误率的时间窗口（秒）
+latency_alpha = 0.3  # 提交耗时的平滑系数
+cooldown_errors = 3  # 连续失败多少次后进入冷却
+default_cooldown = 60  # 默认冷却时间（秒）
+auth_cooldown = 600  # Token无效时的冷却时间（秒）
+quota_cooldown = 3600  # 额度用尽且上游没有给出恢复时间时，多久后再尝试（秒）
+
+
+class _TokenStats:
+    """单个Token的实时状态"""
+
+    def __init__(self):
+        self.active = 0  # 当前并发数
+        self.remote = 0  # 其他进程占用的并发数，续期租约时更新
+        self.unleased = 0  # 租约写入失败时占用的并发数，这些并发没有对应的租约
+        self.results: deque[tuple[float, bool]] = deque()  # (时间, 是否成功)
+        self.latency = 0.0  # 平滑后的提交耗时（秒）
+        self.failures = 0  # 连续失败次数
+        self.cooldown_until = 0.0
+        self.exhausted_until = 0.0  # 额度用尽，恢复前不参与调度
+
+
+class TokenScheduler:
+    """根据实时并发、近期错误率、提交耗时和冷却状态选择Token"""
+
+    def __init__(self, tokens: list[str], task_limit: int, strategy: str = "最少负载"):
+        self.task_limit = task_limit
+        self.strategy = strategy
+        self.stats = {token: _TokenStats() for token in tokens}
+        self.usage: UsageLedger | None = None  # 初始化数据库后设置
+        self.leases: LeaseStore | None = None  # 多个进程共享Token时设置
+
+    def _budget(self, token: str) -> float:
+        """今天剩余的额度，未配置每日额度时用已用次数的相反数代替，越大越优先"""
+        if self.usage is None:
+            return 0
+        remaining = self.usage.remaining(token)
+        if remaining is None:
+            return -self.usage.used_today(token)
+        return remaining
+
+    @property
+    def tokens(self) -> list[str]:
+        return list(self.stats)
+
+    def find(self, auth_xor: str | None) -> str | None:
+        """根据数据库中记录的Token后缀找回完整Token"""
+        if not auth_xor:
+            return None
+        return next((t for t in self.stats if t.endswith(auth_xor)), None)
+
+    def error_rate(self, token: str) -> float:
+        stats = self.stats[token]
+        expire = time.monotonic() - error_window
+        while stats.results and stats.results[0][0] < expire:
+            stats.results.popleft()
+        if not stats.results:
+            return 0.0
+        return sum(1 for _, ok in stats.results if not ok) / len(stats.results)
+
+    def candidates(self, exclude=()) -> list[str]:
+        """返回可用的Token，按优先级排序"""
+        now = time.monotonic()
+        tokens = [
+            t
+            for t, s in self.stats.items()
+            if t not in exclude
+            and s.active + s.remote < self.task_limit
+            and s.cooldown_until <= now
+            and s.exhausted_until <= now
+            and (self.usage is None or self.usage.remaining(t) != 0)
+        ]
+        if self.strategy == "加权随机":
+            return self._weighted_order(tokens)
+        # 最少负载：依次比较负载、错误率、剩余额度、提交耗时，完全相同时随机
+        random.shuffle(tokens)
+        return sorted(
+            tokens,
+            key=lambda t: (
+                self.stats[t].active + self.stats[t].remote,
+                round(self.error_rate(t), 1),
+                -self._budget(t),
+                self.stats[t].latency,
+            ),
+        )
+
+    def _weighted_order(self, tokens: list[str]) -> list[str]:
+        """按剩余并发、成功率、剩余额度和耗时加权，不放回地随机排序"""
+        weights = {
+            t: (self.task_limit - self.stats[t].active - self.stats[t].remote)
+            * (1.05 - self.error_rate(t))
+            * self._quota_weight(t)
+            / (1 + self.stats[t].latency / 10)
+            for t in tokens
+        }
+        order = []
+        while weights:
+            token = random.choices(list(weights), weights=list(weights.values()))[0]
+            order.append(token)
+            del weights[token]
+        return order
+
+    def _quota_weight(self, token: str) -> float:
+        """剩余额度占每日额度的比例，未配置每日额度时为1"""
+        if self.usage is None or not self.usage.daily_quota:
+            return 1.0
+        return self.usage.remaining(token) / self.usage.daily_quota
+
+    def out_of_quota(self) -> bool:
+        """是否所有Token今天的额度都已用完"""
+        now = time.monotonic()
+        return bool(self.stats) and all(
+            s.exhausted_until > now
+            or (self.usage is not None and self.usage.remaining(t) == 0)
+            for t, s in self.stats.items()
+        )
+
+    def next_available_in(self) -> float | None:
+        """最早结束冷却的Token还需要等待的秒数，没有冷却中的Token时返回None"""
+        now = time.monotonic()
+        waits = [
+            max(s.cooldown_until, s.exhausted_until) - now
+            for s in self.stats.values()
+            if max(s.cooldown_until, s.exhausted_until) > now
+            and s.active + s.remote < self.task_limit
+        ]
+        return min(waits) if waits else None
+
+    async def acquire(self, token: str, force: bool = False) -> bool:
+        """记录并发，共享租约时其他进程已占满则返回False；force 为True时超出上限也占用"""
+        stats = self.stats[token]
+        if self.leases:
+            try:
+                acquired = await self.leases.acquire(token, self.task_limit, force)
+            except Exception as e:
+                # 共享文件被锁住太久或无法写入时，按本进程已知的占用判断
+                logger.warning(f"占用并发租约失败，改为只按本实例统计: {e}")
+                acquired = force or stats.active + stats.remote < self.task_limit
+                if acquired:
+                    stats.unleased += 1
+            if not acquired:
+                # 等下次续期时再同步其他进程的实际占用
+                stats.remote = max(stats.remote, self.task_limit - stats.active)
+                return False
+        if stats.active >= self.task_limit:
+            logger.warning(f"Token {token[-4:]} 并发数已达上限，但仍尝试使用")
+        stats.active += 1
+        return True
+
+    def release(self, token: str):
+        """释放并发"""
+        stats = self.stats[token]
+        if stats.active <= 0:
+            stats.active = stats.unleased = 0
+            logger.warning(f"Token {token[-4:]} 并发数计算错误，已重置为0")
+        else:
+            stats.active -= 1
+            # 先抵消没有租约的并发，不能删掉其他仍在运行的并发的租约
+            if stats.unleased:
+                stats.unleased -= 1
+            elif self.leases:
+                self.leases.release(token)
+
+    def sync_leases(self, remote: dict[str, int]) -> bool:
+        """更新其他进程占用的并发数，返回是否有Token空出了并发"""
+        freed = False
+        for token, stats in self.stats.items():
+            count = remote.get(token[-8:], 0)
+            freed = freed or count < stats.remote
+            stats.remote = count
+        return freed
+
+    def record(self, token: str, ok: bool, latency: float | None = None):
+        """记录一次提交结果，连续失败的Token进入冷却"""
+        stats = self.stats[token]
+        stats.results.append((time.monotonic(), ok))
+        if latency is not None:
+            stats.latency = (
+                latency
+                if not stats.latency
+                else latency_alpha * latency + (1 - latency_alpha) * stats.latency
+            )
+        if ok:
+            stats.failures = 0
+            if self.usage:
+                self.usage.record_submit(token)
+            return
+        stats.failures += 1
+        if stats.failures >= cooldown_errors:
+            stats.failures = 0
+            self.cooldown(token, default_cooldown)
+
+    def record_failure(
+        self,
+        token: str,
+        kind: str,
+        retry_after: float | None = None,
+        latency: float | None = None,
+    ):
+        """按错误类型记录一次提交失败；提示词或图片的问题与Token无关，不计入错误率"""
+        if kind in ("content", "invalid"):
+            return
+        if kind == "quota":
+            self.exhaust(token, retry_after or quota_cooldown)
+            if self.usage:
+                self.usage.record_quota(token, retry_after or quota_cooldown)
+            return
+        self.record(token, False, latency)
+        if kind == "auth":
+            logger.error(f"Token {token[-4:]} 认证失败，可能已失效")
+            self.cooldown(token, auth_cooldown)
+        elif kind == "rate_limit":
+            self.cooldown(token, retry_after or default_cooldown)
+
+    def exhaust(self, token: str, seconds: float):
+        """标记Token额度用尽，恢复前直接跳过，不再请求上游"""
+        stats = self.stats[token]
+        stats.exhausted_until = max(stats.exhausted_until, time.monotonic() + seconds)
+        logger.warning(f"Token {token[-4:]} 额度用尽，{seconds / 60:.0f} 分钟后再尝试")
+
+    def cooldown(self, token: str, seconds: float):
+        """让Token在一段时间内不参与调度"""
+        stats = self.stats[token]
+        stats.cooldown_until = max(stats.cooldown_until, time.monotonic() + seconds)
+        logger.warning(f"Token {token[-4:]} 进入冷却，{seconds:.0f}s 内不再调度")
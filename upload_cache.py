@@ -0,0 +1,116 @@
+import hashlib
+import asyncio
+from typing import Awaitable, Callable
+from datetime import datetime, timedelta
+from .db import Database
+
+
+class UploadCache:
+    """按 (图片哈希, Token后缀) 缓存上传后的 upload_id，相同图片不再重复上传"""
+
+    def __init__(self, db: Database, ttl_hours: int, max_entries: int):
+        self.db = db
+        self.ttl_hours = ttl_hours
+        self.max_entries = max_entries
+        self.uploading: dict[tuple[str, str], asyncio.Future] = {}  # 正在进行的上传
+
+    async def initialize(self):
+        await asyncio.gather(
+            self.db.execute("""
+            CREATE TABLE IF NOT EXISTS upload_cache (
+                image_hash TEXT NOT NULL,
+                token_suffix TEXT NOT NULL,
+                upload_id TEXT NOT NULL,
+                created_at DATETIME,
+                last_used_at DATETIME,
+                PRIMARY KEY (image_hash, token_suffix)
+            )
+        """),
+            self.db.execute(
+                "CREATE INDEX IF NOT EXISTS idx_upload_cache_last_used ON upload_cache (last_used_at)"
+            ),
+        )
+
+    @staticmethod
+    def digest(image_bytes: bytes) -> str:
+        return hashlib.sha256(image_bytes).hexdigest()
+
+    def _expire_before(self) -> str:
+        return (datetime.now() - timedelta(hours=self.ttl_hours)).strftime(
+            "%Y-%m-%d %H:%M:%S"
+        )
+
+    async def get(self, image_hash: str, authorization: str) -> str | None:
+        """查找未过期的 upload_id，命中时刷新最近使用时间"""
+        row = await self.db.fetchone(
+            """
+            SELECT upload_id FROM upload_cache
+            WHERE image_hash = ? AND token_suffix = ? AND created_at >= ?
+            """,
+            (image_hash, authorization[-8:], self._expire_before()),
+        )
+        if not row:
+            return None
+        self.db.execute_later(
+            "UPDATE upload_cache SET last_used_at = ? WHERE image_hash = ? AND token_suffix = ?",
+            (
+                datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                image_hash,
+                authorization[-8:],
+            ),
+        )
+        return row[0]
+
+    async def put(self, image_hash: str, authorization: str, upload_id: str):
+        """写入缓存，并清理过期和超出容量的条目"""
+        datetime_now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        await self.db.execute(
+            """
+            INSERT OR REPLACE INTO upload_cache (image_hash, token_suffix, upload_id, created_at, last_used_at)
+            VALUES (?, ?, ?, ?, ?)
+            """,
+            (image_hash, authorization[-8:], upload_id, datetime_now, datetime_now),
+        )
+        self.db.execute_later(
+            "DELETE FROM upload_cache WHERE created_at < ?", (self._expire_before(),)
+        )
+        # 超出容量时按最近使用时间淘汰
+        self.db.execute_later(
+            """
+            DELETE FROM upload_cache WHERE rowid IN (
+                SELECT rowid FROM upload_cache ORDER BY last_used_at DESC LIMIT -1 OFFSET ?
+            )
+            """,
+            (self.max_entries,),
+        )
+
+    async def get_or_upload(
+        self,
+        image_hash: str,
+        authorization: str,
+        upload: Callable[[], Awaitable[tuple[str | None, str | None]]],
+    ) -> tuple[str | None, str | None]:
+        """命中缓存时直接返回 upload_id，否则上传并写入缓存；同一张图片的并发上传只执行一次"""
+        key = (image_hash, authorization[-8:])
+        if key not in self.uploading:
+            upload_id = await self.get(image_hash, authorization)
+            if upload_id:
+                return upload_id, None
+        future = self.uploading.get(key)
+        if future is None:
+            future = self.uploading[key] = asyncio.ensure_future(
+                self._upload(image_hash, authorization, upload)
+            )
+            future.add_done_callback(lambda _: self.uploading.pop(key, None))
+        return await asyncio.shield(future)
+
+    async def _upload(
+        self,
+        image_hash: str,
+        authorization: str,
+        upload: Callable[[], Awaitable[tuple[str | None, str | None]]],
+    ) -> tuple[str | None, str | None]:
+        upload_id, err = await upload()
+        if upload_id and not err:
+            await self.put(image_hash, authorization, upload_id)
+        return upload_id, err
@@ -0,0 +1,115 @@
+from datetime import datetime, timedelta
+from .db import Database
+
+
+class UsageLedger:
+    """按Token后缀和日期记录每天的提交次数和额度用尽情况，当天的数据同时保存在内存中供调度使用"""
+
+    def __init__(self, db: Database, daily_quota: int):
+        self.db = db
+        self.daily_quota = daily_quota  # 每个Token每天可生成的数量，0表示未知
+        self.day = ""
+        self.used: dict[str, int] = {}
+        self.exhausted: dict[str, datetime] = {}  # Token后缀 -> 额度预计恢复的时间
+
+    async def initialize(self):
+        await self.db.execute("""
+            CREATE TABLE IF NOT EXISTS token_usage (
+                token_suffix TEXT NOT NULL,
+                day TEXT NOT NULL,
+                submitted INTEGER NOT NULL DEFAULT 0,
+                quota_errors INTEGER NOT NULL DEFAULT 0,
+                exhausted_until DATETIME,
+                updated_at DATETIME,
+                PRIMARY KEY (token_suffix, day)
+            )
+        """)
+        self.day = self._today()
+        rows = await self.db.fetchall(
+            "SELECT token_suffix, submitted FROM token_usage WHERE day = ?",
+            (self.day,),
+        )
+        if not rows:
+            # 升级后的第一天没有账本，按当天的任务记录估算
+            rows = await self.db.fetchall(
+                """
+                SELECT auth_xor, COUNT(*) FROM video_data
+                WHERE created_at >= ? AND auth_xor IS NOT NULL GROUP BY auth_xor
+                """,
+                (self.day,),
+            )
+        self.used = dict(rows)
+        # 额度恢复时间可能在第二天，不按日期筛选
+        rows = await self.db.fetchall(
+            """
+            SELECT token_suffix, MAX(exhausted_until) FROM token_usage
+            WHERE exhausted_until > ? GROUP BY token_suffix
+            """,
+            (datetime.now().strftime("%Y-%m-%d %H:%M:%S"),),
+        )
+        for suffix, exhausted_until in rows:
+            self.exhausted[suffix] = datetime.strptime(
+                exhausted_until, "%Y-%m-%d %H:%M:%S"
+            )
+
+    @staticmethod
+    def _today() -> str:
+        return datetime.now().strftime("%Y-%m-%d")
+
+    def _rollover(self):
+        """跨天后清空内存中的用量"""
+        today = self._today()
+        if today != self.day:
+            self.day = today
+            self.used.clear()
+
+    def record_submit(self, token: str):
+        """记录一次成功提交"""
+        self._rollover()
+        suffix = token[-8:]
+        self.used[suffix] = self.used.get(suffix, 0) + 1
+        self.db.execute_later(
+            """
+            INSERT INTO token_usage (token_suffix, day, submitted, updated_at) VALUES (?, ?, 1, ?)
+            ON CONFLICT (token_suffix, day) DO UPDATE SET submitted = submitted + 1, updated_at = excluded.updated_at
+            """,
+            (suffix, self.day, datetime.now().strftime("%Y-%m-%d %H:%M:%S")),
+        )
+
+    def record_quota(self, token: str, seconds: float):
+        """记录一次额度用尽的错误，seconds 为预计恢复前的秒数"""
+        self._rollover()
+        suffix = token[-8:]
+        now = datetime.now()
+        until = now + timedelta(seconds=seconds)
+        self.exhausted[suffix] = until
+        self.db.execute_later(
+            """
+            INSERT INTO token_usage (token_suffix, day, quota_errors, exhausted_until, updated_at) VALUES (?, ?, 1, ?, ?)
+            ON CONFLICT (token_suffix, day) DO UPDATE SET
+                quota_errors = quota_errors + 1, exhausted_until = excluded.exhausted_until, updated_at = excluded.updated_at
+            """,
+            (
+                suffix,
+                self.day,
+                until.strftime("%Y-%m-%d %H:%M:%S"),
+                now.strftime("%Y-%m-%d %H:%M:%S"),
+            ),
+        )
+
+    def used_today(self, token: str) -> int:
+        self._rollover()
+        return self.used.get(token[-8:], 0)
+
+    def exhausted_for(self, token: str) -> float:
+        """距离额度恢复还有多少秒，没有用尽时返回0"""
+        until = self.exhausted.get(token[-8:])
+        if until is None:
+            return 0.0
+        return max(0.0, (until - datetime.now()).total_seconds())
+
+    def remaining(self, token: str) -> int | None:
+        """今天剩余的额度，未配置每日额度时返回None"""
+        if not self.daily_quota:
+            return None
+        return max(0, self.daily_quota - self.used_today(token))
@@ -1,123 +1,322 @@
 import time
 import asyncio
 import json
-from PIL import Image
+from datetime import datetime
+from urllib.parse import urlparse, parse_qs
+from typing import NamedTuple
 from io import BytesIO
-from curl_cffi import requests, AsyncSession, CurlMime
-from curl_cffi.requests.exceptions import Timeout
 from astrbot.api import logger
 from uuid import uuid4
-from .openai_sentinel.proof_of_work import get_pow_token
+from .image_normalize import register_heif
+from .metrics import metrics
+from .resilience import Resilience, Throttled, parse_retry_after
+from .http_pool import HttpPool, Timeout, SSLError, mime
 
-# 轮询参数
-max_interval = 60  # 最大间隔
-min_interval = 5  # 最小间隔
-total_wait = 360  # 最多等待6分钟
+video_write_chunk = 1024 * 1024  # 下载视频时每次写入文件的大小
+# 按 generation_id 获取单个草稿的接口，网页端未公开，路径为推测
+generation_path = "/backend/project_y/profile/drafts/{generation_id}"
+# 上游错误分类用的关键字，接口未公开，按已知的错误码和提示语匹配
+quota_keywords = ("quota", "daily limit", "usage limit", "credits")
+content_keywords = ("policy", "moderation", "safety", "violat", "guardrail")
+
+
+class UpstreamError(str):
+    """带分类的错误信息，可以像普通字符串一样使用
+
+    kind 取值：quota 额度用尽、auth Token无效、rate_limit 限流、transient 网络或上游暂时故障、
+    content 内容审核不通过、invalid 请求参数有误、unknown 无法判断
+    """
+
+    kind: str
+    retry_after: float | None
+
+    def __new__(
+        cls, message: str, kind: str = "unknown", retry_after: float | None = None
+    ):
+        self = super().__new__(cls, message)
+        self.kind = kind
+        self.retry_after = retry_after
+        return self
+
+
+class ImageInfo(NamedTuple):
+    """参考图片的元数据"""
+
+    format: str | None
+    width: int
+    height: int
+    orientation: str  # landscape 或 portrait
+    size: int  # 字节数
 
 
 class Utils:
     def __init__(
-        self, sora_base_url: str, chatgpt_base_url: str, proxy: str, model: str
+        self,
+        sora_base_url: str,
+        chatgpt_base_url: str,
+        proxy: str,
+        model: str,
+        image_max_bytes: int = 20 * 1024 * 1024,
+        max_clients: int = 10,
     ):
         self.sora_base_url = sora_base_url
         self.chatgpt_base_url = chatgpt_base_url
         proxies = {"http": proxy, "https": proxy} if proxy else None
-        self.session = AsyncSession(impersonate="chrome136", proxies=proxies)
+        self.pool = HttpPool("chrome136", proxies, max_clients)
         self.model = model
+        self.image_max_bytes = image_max_bytes
+        self.resilience = Resilience()
         self.UA = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/141.0.0.0 Safari/537.36 Edg/141.0.0.0"
 
-    def _handle_image(self, image_bytes: bytes) -> bytes | None:
+    async def _request(
+        self,
+        endpoint: str,
+        method: str,
+        url: str,
+        authorization: str | None = None,
+        **kwargs,
+    ):
+        """经过限流和熔断发送请求，被拦截时抛出 Throttled"""
+        token = authorization or ""
+        await self.resilience.acquire(endpoint, token)
+        if authorization:
+            kwargs["headers"] = {
+                "Authorization": authorization,
+                **kwargs.get("headers", {}),
+            }
+        try:
+            response = await self.pool.request(method, url, **kwargs)
+        except Exception:
+            self.resilience.record(endpoint, token, None)
+            raise
+        self.resilience.record(
+            endpoint, token, response.status_code, response.headers.get("Retry-After")
+        )
+        return response
+
+    @staticmethod
+    def _classify(response, prefix: str) -> UpstreamError:
+        """按状态码、错误码和提示语给失败的响应分类"""
         try:
+            error = response.json().get("error") or {}
+        except Exception:
+            error = {}
+        if not isinstance(error, dict):
+            error = {"message": str(error)}
+        status_code = response.status_code
+        message = error.get("message") or f"HTTP {status_code}"
+        text = f"{error.get('code') or ''} {error.get('type') or ''} {message}".lower()
+        retry_after = parse_retry_after(response.headers.get("Retry-After"))
+        # 认证失败的提示语也可能带有 quota 之类的词，先按状态码判断
+        if status_code in (401, 403):
+            kind = "auth"
+        elif any(k in text for k in quota_keywords):
+            kind = "quota"
+        elif status_code == 429:
+            kind = "rate_limit"
+        elif status_code >= 500:
+            kind = "transient"
+        elif any(k in text for k in content_keywords):
+            kind = "content"
+        elif status_code in (400, 422):
+            kind = "invalid"
+        else:
+            kind = "unknown"
+        return UpstreamError(f"{prefix}: {message}", kind, retry_after)
+
+    def _probe_image(self, image_bytes: bytes) -> ImageInfo | None:
+        """读取图片格式和尺寸，无法识别时返回None"""
+        from PIL import Image, UnidentifiedImageError
+
+        register_heif()
+        try:
+            # Image.open 只解析文件头，不会解码整张图片
             with Image.open(BytesIO(image_bytes)) as img:
-                # 如果不是 GIF，直接返回原图
-                if img.format != "GIF":
-                    return image_bytes
-                # 处理 GIF
-                buf = BytesIO()
-                # 判断是否为动画 GIF（多帧）
-                if getattr(img, "is_animated", False) and img.n_frames > 1:
-                    img.seek(0)  # 只取第一帧
-                # 单帧 GIF 或者多帧 GIF 的第一帧都走下面的保存逻辑
-                img = img.convert("RGBA")
-                img.save(buf, format="PNG")
-                return buf.getvalue()
-        except Exception as e:
-            logger.warning(f"GIF 处理失败，返回原图: {e}")
-            return image_bytes
+                width, height = img.size
+                # 手机照片常用EXIF记录旋转，按摆正后的尺寸判断方向
+                if img.getexif().get(0x0112, 1) in (5, 6, 7, 8):
+                    width, height = height, width
+                return ImageInfo(
+                    format=img.format,
+                    width=width,
+                    height=height,
+                    orientation="landscape" if width > height else "portrait",
+                    size=len(image_bytes),
+                )
+        except UnidentifiedImageError:
+            return None
+
+    async def _stream_image(self, url: str, verify: bool = True) -> bytes | None:
+        """流式下载图片，超过大小上限时立即中止并返回None"""
+        buf = bytearray()
+        async with self.pool.stream("GET", url, verify=verify) as response:
+            if response.status_code != 200:
+                raise ValueError(f"HTTP {response.status_code}")
+            content_length = response.headers.get("Content-Length")
+            if content_length and int(content_length) > self.image_max_bytes:
+                return None
+            async for chunk in response.aiter_content():
+                buf.extend(chunk)
+                if len(buf) > self.image_max_bytes:
+                    return None
+        return bytes(buf)
 
-    async def download_image(self, url: str) -> tuple[bytes | None, str | None]:
+    @metrics.timed("download_image")
+    async def download_image(
+        self, url: str
+    ) -> tuple[bytes | None, ImageInfo | None, str | None]:
+        """下载图片并读取元数据，返回 (图片, 元数据, 错误信息)"""
         try:
-            response = await self.session.get(url)
-            content = await asyncio.to_thread(self._handle_image, response.content)
-            return content, None
-        except (
-            requests.exceptions.SSLError,
-            requests.exceptions.CertificateVerifyError,
-        ):
-            # 关闭SSL验证
-            response = await self.session.get(url, verify=False)
-            content = await asyncio.to_thread(self._handle_image, response.content)
-            return content, None
+            try:
+                image_bytes = await self._stream_image(url)
+            except SSLError:
+                # 关闭SSL验证
+                image_bytes = await self._stream_image(url, verify=False)
+            if image_bytes is None:
+                return (
+                    None,
+                    None,
+                    f"下载图片失败：图片超过 {self.image_max_bytes // 1024 // 1024}MB",
+                )
+            image_info = await asyncio.to_thread(self._probe_image, image_bytes)
+            if image_info is None:
+                return None, None, "下载图片失败：无法识别的图片格式"
+            return image_bytes, image_info, None
         except Timeout as e:
             logger.error(f"网络请求超时: {e}")
-            return None, "下载图片失败：网络请求超时，请检查网络连通性"
+            return None, None, "下载图片失败：网络请求超时，请检查网络连通性"
         except Exception as e:
             logger.error(f"下载图片失败: {e}")
-            return None, "下载图片失败"
+            return None, None, "下载图片失败"
 
-    def get_image_orientation(self, image_bytes: bytes) -> str:
-        # 把 bytes 转成图片对象
-        img = Image.open(BytesIO(image_bytes))
+    @metrics.timed("download_video")
+    async def download_video(
+        self, url: str, path: str, max_bytes: int
+    ) -> tuple[int | None, str | None]:
+        """流式下载视频到文件，不在内存中保存整个视频，返回 (文件大小, 错误信息)"""
+        size = 0
+        buf = bytearray()
+        try:
+            with open(path, "wb") as f:
+                async with self.pool.stream("GET", url) as response:
+                    if response.status_code != 200:
+                        return None, f"下载视频失败：HTTP {response.status_code}"
+                    content_length = response.headers.get("Content-Length")
+                    if content_length and int(content_length) > max_bytes:
+                        return None, "下载视频失败：视频超过缓存大小上限"
+                    async for chunk in response.aiter_content():
+                        size += len(chunk)
+                        if size > max_bytes:
+                            return None, "下载视频失败：视频超过缓存大小上限"
+                        buf.extend(chunk)
+                        # 攒够一块再交给线程写入，避免频繁切换线程
+                        if len(buf) >= video_write_chunk:
+                            await asyncio.to_thread(f.write, bytes(buf))
+                            buf.clear()
+                if buf:
+                    await asyncio.to_thread(f.write, bytes(buf))
+            return size, None
+        except Timeout as e:
+            logger.error(f"网络请求超时: {e}")
+            return None, "下载视频失败：网络请求超时"
+        except Exception as e:
+            logger.error(f"下载视频失败: {e}")
+            return None, "下载视频失败"
 
-        width, height = img.size
-        if width > height:
-            return "landscape"
-        elif width < height:
-            return "portrait"
-        else:
-            return "portrait"
+    @staticmethod
+    def url_expires_at(url: str) -> datetime | None:
+        """从签名下载地址的 se 参数读取过期时间（本地时间），没有时返回None"""
+        try:
+            se = parse_qs(urlparse(url).query).get("se")
+            if not se:
+                return None
+            expires = datetime.fromisoformat(se[0].replace("Z", "+00:00"))
+            if expires.tzinfo:
+                expires = expires.astimezone().replace(tzinfo=None)
+            return expires
+        except ValueError:
+            return None
+
+    @metrics.timed("check_url")
+    async def check_url(self, url: str) -> bool | None:
+        """用HEAD请求检查下载地址是否仍然有效，网络异常等无法判断时返回None"""
+        try:
+            response = await self.pool.request("HEAD", url, timeout=10)
+            if response.status_code in (200, 206):
+                return True
+            if response.status_code in (401, 403, 404, 410):
+                return False
+            return None
+        except Exception as e:
+            logger.warning(f"检查下载地址失败: {e}")
+            return None
 
+    @staticmethod
+    def _image_type(image_bytes: bytes) -> tuple[str, str]:
+        """根据文件头判断上传时的扩展名和Content-Type"""
+        if image_bytes.startswith(b"\xff\xd8"):
+            return "jpg", "image/jpeg"
+        if image_bytes[:4] == b"RIFF" and image_bytes[8:12] == b"WEBP":
+            return "webp", "image/webp"
+        return "png", "image/png"
+
+    @metrics.timed("upload_images")
     async def upload_images(
         self, authorization: str, image_bytes: bytes
     ) -> tuple[str | None, str | None]:
         try:
-            mp = CurlMime()
+            mp = mime()
+            extension, content_type = self._image_type(image_bytes)
             mp.addpart(
                 name="file",
-                filename=f"{int(time.time() * 1000)}.png",
-                content_type="image/png",
+                filename=f"{int(time.time() * 1000)}.{extension}",
+                content_type=content_type,
                 data=image_bytes,
             )
-            response = await self.session.post(
+            response = await self._request(
+                "upload_images",
+                "POST",
                 self.sora_base_url + "/backend/uploads",
+                authorization,
                 multipart=mp,
-                headers={"Authorization": authorization},
             )
             if response.status_code == 200:
                 result = response.json()
                 return result.get("id"), None
             else:
-                result = response.json()
-                err_str = f"上传图片失败: {result.get('error', {}).get('message')}"
-                logger.error(err_str)
-                return None, err_str
+                err = self._classify(response, "上传图片失败")
+                logger.error(err)
+                return None, err
+        except Throttled as e:
+            return None, UpstreamError(
+                f"上传图片失败：{e}", "rate_limit", e.retry_after
+            )
         except Timeout as e:
             logger.error(f"网络请求超时: {e}")
-            return None, "上传图片失败：网络请求超时，请检查网络连通性"
+            return None, UpstreamError(
+                "上传图片失败：网络请求超时，请检查网络连通性", "transient"
+            )
         except Exception as e:
             logger.error(f"上传图片失败: {e}")
-            return None, "上传图片失败"
+            return None, UpstreamError("上传图片失败", "transient")
         finally:
             mp.close()
 
+    @metrics.timed("get_sentinel")
     async def get_sentinel(self) -> tuple[str | None, str | None]:
+        # 浏览器指纹列表较大，第一次提交任务时才导入
+        from .openai_sentinel.proof_of_work import get_pow_token
+
         pow_token = await asyncio.to_thread(get_pow_token, self.UA)
         id = str(uuid4())
         flow = "sora_2_create_task"
         payload = {"flow": flow, "id": id, "p": pow_token}
         try:
-            response = await self.session.post(
-                self.chatgpt_base_url + "/backend-api/sentinel/req", json=payload
+            response = await self._request(
+                "get_sentinel",
+                "POST",
+                self.chatgpt_base_url + "/backend-api/sentinel/req",
+                json=payload,
             )
             if response.status_code == 200:
                 result = response.json()
@@ -131,22 +330,38 @@ class Utils:
                 }
                 return json.dumps(sentinel_token), None
             else:
-                err_str = "获取Sentinel tokens失败"
-                logger.error(f"{err_str}: {response.text}")
-                return None, err_str
+                err = self._classify(response, "获取Sentinel tokens失败")
+                logger.error(f"{err}: {response.text}")
+                return None, UpstreamError(
+                    "获取Sentinel tokens失败", err.kind, err.retry_after
+                )
+        except Throttled as e:
+            return None, UpstreamError(
+                f"获取Sentinel tokens失败：{e}", "rate_limit", e.retry_after
+            )
         except Timeout as e:
             logger.error(f"网络请求超时: {e}")
-            return None, "获取Sentinel tokens失败：网络请求超时，请检查网络连通性"
+            return None, UpstreamError(
+                "获取Sentinel tokens失败：网络请求超时，请检查网络连通性", "transient"
+            )
         except Exception as e:
             logger.error(f"获取Sentinel tokens失败: {e}")
-            return None, "获取Sentinel tokens失败"
+            return None, UpstreamError("获取Sentinel tokens失败", "transient")
 
+    @metrics.timed("create_video")
     async def create_video(
-        self, prompt: str, screen_mode: str, image_id: str, authorization: str
+        self,
+        prompt: str,
+        screen_mode: str,
+        image_id: str,
+        authorization: str,
+        sentinel_token: str | None = None,
     ) -> tuple[str | None, str | None]:
-        sentinel_token, err = await self.get_sentinel()
-        if err:
-            return None, err
+        """提交生成任务；sentinel_token 与Token无关，换Token重试时可以复用"""
+        if sentinel_token is None:
+            sentinel_token, err = await self.get_sentinel()
+            if err:
+                return None, err
         inpaint_items = [{"kind": "upload", "upload_id": image_id}] if image_id else []
         payload = {
             "kind": "video",
@@ -167,128 +382,143 @@ class Utils:
             "storyboard_id": None,
         }
         try:
-            response = await self.session.post(
+            response = await self._request(
+                "create_video",
+                "POST",
                 self.sora_base_url + "/backend/nf/create",
+                authorization,
                 json=payload,
-                headers={
-                    "Authorization": authorization,
-                    "openai-sentinel-token": sentinel_token,
-                },
+                headers={"openai-sentinel-token": sentinel_token},
             )
             if response.status_code == 200:
                 result = response.json()
                 return result.get("id"), None
             else:
-                result = response.json()
-                err_str = f"提交任务失败: {result.get('error', {}).get('message')}"
-                logger.error(f"{err_str}，Token: {authorization[-8:]}")
-                return None, err_str
+                err = self._classify(response, "提交任务失败")
+                logger.error(f"{err}，Token: {authorization[-8:]}，类型: {err.kind}")
+                return None, err
+        except Throttled as e:
+            return None, UpstreamError(
+                f"提交任务失败：{e}", "rate_limit", e.retry_after
+            )
         except Timeout as e:
             logger.error(f"网络请求超时: {e}")
-            return None, "提交任务失败：网络请求超时，请检查网络连通性"
+            return None, UpstreamError(
+                "提交任务失败：网络请求超时，请检查网络连通性", "transient"
+            )
         except Exception as e:
             logger.error(f"提交任务失败: {e}")
-            return None, "提交任务失败"
+            return None, UpstreamError("提交任务失败", "transient")
 
-    async def pending_video(
-        self, task_id: str, authorization: str
-    ) -> tuple[str | None, str | None, float]:
+    @metrics.timed("fetch_pending")
+    async def fetch_pending(
+        self, authorization: str
+    ) -> tuple[dict[str, tuple[str | None, float]] | None, str | None, str | None]:
+        """获取该Token下全部排队中的任务，返回 (任务表, 失败状态, 错误信息)"""
         try:
-            response = await self.session.get(
+            response = await self._request(
+                "fetch_pending",
+                "GET",
                 self.sora_base_url + "/backend/nf/pending",
-                headers={"Authorization": authorization},
+                authorization,
             )
             if response.status_code == 200:
                 result = response.json()
-                for item in result:
-                    if item.get("id") == task_id:
-                        return item.get("status"), None, item.get("progress_pct") or 0
-                return "Done", None, 0  # 任务不存在，视为完成
+                tasks = {
+                    item.get("id"): (item.get("status"), item.get("progress_pct") or 0)
+                    for item in result
+                }
+                return tasks, None, None
+            elif response.status_code == 429 or response.status_code >= 500:
+                # 限流或上游暂时故障，由轮询器推迟查询
+                err_str = f"视频状态查询失败：HTTP {response.status_code}"
+                logger.warning(err_str)
+                return None, "Throttled", err_str
             else:
                 result = response.json()
                 err_str = f"视频状态查询失败: {result.get('error', {}).get('message')}"
                 logger.error(err_str)
-                return "Failed", err_str, 0
+                return None, "Failed", err_str
+        except Throttled as e:
+            return None, "Throttled", f"视频状态查询失败：{e}"
         except Timeout as e:
             logger.error(f"网络请求超时: {e}")
-            return None, "视频状态查询失败：网络请求超时，请检查网络连通性"
+            return None, "EXCEPTION", "视频状态查询失败：网络请求超时，请检查网络连通性"
         except Exception as e:
             logger.error(f"视频状态查询失败: {e}")
-            return "EXCEPTION", "视频状态查询失败", 0
+            return None, "EXCEPTION", "视频状态查询失败"
 
-    async def poll_pending_video(
-        self, task_id: str, authorization: str
-    ) -> tuple[str, str | None]:
-        """轮询等待视频生成完成"""
-        interval = max_interval
-        elapsed = 0  # 已等待时间
-        while elapsed < total_wait:
-            status, err, progress = await self.pending_video(task_id, authorization)
-            if status == "Done":
-                return "Done", None  # 任务不存在，视为完成
-            elif status == "Failed":
-                logger.error("视频状态查询失败")
-                return (
-                    "Failed",
-                    f"视频状态查询失败，ID: {task_id}，进度: {progress * 100:.2f}%，错误: {err}",
-                )
-            elif status == "EXCEPTION":
-                logger.error("视频状态查询异常")
-                return (
-                    "EXCEPTION",
-                    f"视频状态查询异常，ID: {task_id}，进度: {progress * 100:.2f}%",
-                )
-            # 等待当前轮询间隔
-            wait_time = min(interval, total_wait - elapsed)
-            await asyncio.sleep(wait_time)
-            elapsed += wait_time
-            # 反向指数退避：间隔逐步减小
-            interval = max(min_interval, interval // 2)
-            logger.debug(
-                f"视频处理中，{interval}s 后再次请求... 进度: {progress * 100:.2f}%"
-            )
-        logger.error("视频状态查询超时")
-        return (
-            "Timeout",
-            f"视频状态查询超时，ID: {task_id}，生成进度: {progress * 100:.2f}%",
-        )
-
-    async def fetch_video_url(
-        self, task_id: str, authorization: str, limit: int = 15
-    ) -> tuple[str, str | None, str | None, str | None]:
+    @metrics.timed("fetch_drafts")
+    async def fetch_drafts(
+        self, authorization: str, limit: int = 15, cursor: str | None = None
+    ) -> tuple[list[dict] | None, str | None, str | None, str | None]:
+        """获取一页草稿列表，返回 (草稿列表, 下一页游标, 失败状态, 错误信息)"""
         try:
-            response = await self.session.get(
-                self.sora_base_url + f"/backend/project_y/profile/drafts?limit={limit}",
-                headers={"Authorization": authorization},
+            params = {"limit": limit}
+            if cursor:
+                params["cursor"] = cursor
+            response = await self._request(
+                "fetch_drafts",
+                "GET",
+                self.sora_base_url + "/backend/project_y/profile/drafts",
+                authorization,
+                params=params,
             )
             result = response.json()
             if response.status_code == 200:
-                for item in result.get("items", []):
-                    if item.get("task_id") == task_id:
-                        downloadable_url = item.get("downloadable_url")
-                        if not downloadable_url:
-                            err_str = item.get("reason_str") or item.get("error_reason") or "未知错误"
-                            logger.error(
-                                f"视频链接为空, task_id: {task_id}, reason: {err_str}"
-                            )
-                            return (
-                                "Failed",
-                                None,
-                                item.get("id"),
-                                err_str,
-                            )
-                        return "Done", downloadable_url, item.get("id"), None
-                return "EXCEPTION", None, None, "未找到对应的视频"
+                return result.get("items", []), result.get("cursor"), None, None
+            elif response.status_code == 429 or response.status_code >= 500:
+                # 限流或上游暂时故障，调用方稍后重试
+                err_str = f"获取视频链接失败：HTTP {response.status_code}"
+                logger.warning(err_str)
+                return None, None, None, err_str
             else:
                 err_str = f"获取视频链接失败: {result.get('error', {}).get('message')}"
                 logger.error(err_str)
-                return "Failed", None, None, err_str
+                return None, None, "Failed", err_str
+        except Throttled as e:
+            return None, None, None, f"获取视频链接失败：{e}"
         except Timeout as e:
             logger.error(f"网络请求超时: {e}")
             return None, None, None, "获取视频链接失败：网络请求超时，请检查网络连通性"
         except Exception as e:
             logger.error(f"获取视频链接失败: {e}")
-            return "EXCEPTION", None, None, "获取视频链接失败"
+            return None, None, "EXCEPTION", "获取视频链接失败"
+
+    @metrics.timed("fetch_generation_url")
+    async def fetch_generation_url(
+        self, authorization: str, generation_id: str
+    ) -> tuple[str | None, str | None]:
+        """根据 generation_id 获取新的下载地址，返回 (视频链接, 错误信息)"""
+        try:
+            response = await self._request(
+                "fetch_generation_url",
+                "GET",
+                self.sora_base_url
+                + generation_path.format(generation_id=generation_id),
+                authorization,
+            )
+            if response.status_code == 200:
+                result = response.json()
+                downloadable_url = result.get("downloadable_url")
+                if downloadable_url:
+                    return downloadable_url, None
+                return None, "刷新下载地址失败：视频链接为空"
+            err_str = f"刷新下载地址失败: HTTP {response.status_code}"
+            logger.warning(err_str)
+            return None, err_str
+        except Throttled as e:
+            return None, f"刷新下载地址失败：{e}"
+        except Timeout as e:
+            logger.error(f"网络请求超时: {e}")
+            return None, "刷新下载地址失败：网络请求超时，请检查网络连通性"
+        except Exception as e:
+            logger.error(f"刷新下载地址失败: {e}")
+            return None, "刷新下载地址失败"
+
+    async def warm(self):
+        """预热上游连接"""
+        await self.pool.warm([self.sora_base_url, self.chatgpt_base_url])
 
     async def close(self):
-        await self.session.close()
+        await self.pool.close()
@@ -0,0 +1,124 @@
+import os
+import re
+import time
+import asyncio
+import hashlib
+from collections import OrderedDict
+from astrbot.api import logger
+from .utils import Utils
+
+
+class VideoCache:
+    """按 generation_id 把生成好的视频缓存到本地磁盘，按总大小和闲置时间淘汰"""
+
+    def __init__(self, utils: Utils, cache_dir: str, max_bytes: int, max_days: int):
+        self.utils = utils
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_age = max_days * 86400
+        # generation_id -> (文件大小, 最近使用时间)，按最近使用排序
+        self.entries: OrderedDict[str, tuple[int, float]] = OrderedDict()
+        self.total_bytes = 0
+        self.fetching: dict[str, asyncio.Task] = {}  # 正在进行的下载
+
+    def load(self):
+        """扫描缓存目录重建索引，并清理上次中断的下载"""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        files = []
+        for entry in os.scandir(self.cache_dir):
+            if not entry.is_file():
+                continue
+            if entry.name.endswith(".part"):
+                os.remove(entry.path)
+                continue
+            if not entry.name.endswith(".mp4"):
+                continue
+            stat = entry.stat()
+            files.append((stat.st_mtime, entry.name[: -len(".mp4")], stat.st_size))
+        for last_used, key, size in sorted(files):
+            self.entries[key] = (size, last_used)
+            self.total_bytes += size
+        self._evict()
+
+    @staticmethod
+    def _key(generation_id: str) -> str:
+        # generation_id 来自上游，不能直接信任为文件名
+        if re.fullmatch(r"[\w-]{1,128}", generation_id):
+            return generation_id
+        return hashlib.sha256(generation_id.encode()).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key + ".mp4")
+
+    def get(self, generation_id: str) -> str | None:
+        """命中时返回本地文件路径，并刷新最近使用时间"""
+        key = self._key(generation_id)
+        if key not in self.entries:
+            return None
+        path = self._path(key)
+        now = time.time()
+        try:
+            os.utime(path, (now, now))  # 重启后按修改时间恢复使用顺序
+        except OSError:
+            # 文件被外部删除
+            size, _ = self.entries.pop(key)
+            self.total_bytes -= size
+            return None
+        self.entries[key] = (self.entries[key][0], now)
+        self.entries.move_to_end(key)
+        return path
+
+    async def fetch(
+        self, generation_id: str, video_url: str
+    ) -> tuple[str | None, str | None]:
+        """返回本地文件路径，未缓存时下载；同一个视频的并发下载只执行一次"""
+        path = self.get(generation_id)
+        if path:
+            return path, None
+        key = self._key(generation_id)
+        task = self.fetching.get(key)
+        if task is None:
+            task = self.fetching[key] = asyncio.ensure_future(
+                self._download(key, video_url)
+            )
+            task.add_done_callback(lambda _: self.fetching.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def _download(
+        self, key: str, video_url: str
+    ) -> tuple[str | None, str | None]:
+        path = self._path(key)
+        part = path + ".part"
+        try:
+            size, err = await self.utils.download_video(video_url, part, self.max_bytes)
+            if err:
+                return None, err
+            os.replace(part, path)
+        finally:
+            if os.path.exists(part):
+                os.remove(part)
+        self.entries[key] = (size, time.time())
+        self.total_bytes += size
+        self._evict()
+        return path, None
+
+    def _evict(self):
+        """删除闲置过久的视频，再按最近使用时间淘汰到总大小以内"""
+        expire = time.time() - self.max_age
+        while self.entries:
+            key, (size, last_used) = next(iter(self.entries.items()))
+            if last_used >= expire and self.total_bytes <= self.max_bytes:
+                break
+            self.entries.popitem(last=False)
+            self.total_bytes -= size
+            try:
+                os.remove(self._path(key))
+            except OSError as e:
+                logger.warning(f"删除缓存视频失败: {e}")
+
+    async def close(self):
+        """取消正在进行的下载，未完成的文件会被删除"""
+        tasks = list(self.fetching.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)